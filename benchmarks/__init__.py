@@ -0,0 +1,13 @@
+"""
+Package: benchmarks
+Performance benchmarks for the Products service
+
+Each module can be run on its own, for example:
+  python -m benchmarks.bench_purchase --help
+
+benchmarks.suite times the model and every endpoint at 1k, 100k and 1M
+rows and saves JSON that benchmarks.compare checks against another run.
+
+WARNING: importing the service initializes the database named by
+DATABASE_URI, so point it at a scratch database and not at production.
+"""
@@ -0,0 +1,76 @@
+"""
+Per-row cost of serializing a list of Products
+
+Serializes the same list of Products to JSON bytes through the old
+serialize() + marshal() + restx output path and through the one-pass
+product_dict() with each installed encoder, and reports microseconds
+per row for each.
+
+Usage:
+  DATABASE_URI=sqlite:////tmp/bench.db python -m benchmarks.bench_serialize --rows 10000
+"""
+import argparse
+import json
+import sys
+import time
+from flask_restx import marshal
+from service import app
+from service.common import serializer
+from service.routes import product_dict, product_model, with_pending_likes
+from tests.factories import ProductFactory
+
+
+def marshalled(products):
+    """The old path: serialize(), marshal() and restx's json.dumps"""
+    results = [with_pending_likes(product.serialize()) for product in products]
+    return (json.dumps(marshal(results, product_model)) + "\n").encode()
+
+
+def timed(label, rows, repeat, encode):
+    """Runs encode() repeat times and returns its cost per row"""
+    encode()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = encode()
+    elapsed = (time.perf_counter() - start) / repeat
+    return {
+        "path": label,
+        "rows": rows,
+        "bytes": len(body),
+        "ms": round(elapsed * 1000, 2),
+        "us_per_row": round(elapsed / rows * 1e6, 3),
+    }
+
+
+def main(argv=None):
+    """Runs the benchmark and prints the results as JSON"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    products = ProductFactory.build_batch(args.rows)
+    for number, product in enumerate(products, start=1):
+        product.id = number
+
+    with app.app_context():
+        results = [timed("serialize+marshal+json", args.rows, args.repeat, lambda: marshalled(products))]
+        encoders = ["orjson", "json"] if serializer.orjson else ["json"]
+        for encoder in encoders:
+            results.append(
+                timed(
+                    f"product_dict+{encoder}",
+                    args.rows,
+                    args.repeat,
+                    lambda encoder=encoder: serializer.dumps(
+                        [product_dict(product) for product in products], encoder
+                    ),
+                )
+            )
+    for result in results[1:]:
+        result["speedup"] = round(results[0]["ms"] / result["ms"], 1)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
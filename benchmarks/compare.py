@@ -0,0 +1,62 @@
+"""
+Compares two runs of the benchmark suite
+
+Matches the results of benchmarks.suite by size and benchmark name,
+prints the median of each before and after, and exits with 1 when any
+median got slower by more than --tolerance, so it can gate a commit.
+It reads only the JSON files and does not touch the database.
+
+Usage:
+  python -m benchmarks.compare before.json after.json --tolerance 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, tolerance):
+    """Matches two runs by size and name and flags the slower medians"""
+    before = {(result["size"], result["name"]): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = before.get((result["size"], result["name"]))
+        if not old:
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else 1.0
+        rows.append(
+            {
+                "size": result["size"],
+                "name": result["name"],
+                "baseline_ms": old["median_ms"],
+                "current_ms": result["median_ms"],
+                "ratio": round(ratio, 3),
+                "regression": ratio > 1 + tolerance,
+            }
+        )
+    return rows
+
+
+def main(argv=None):
+    """Prints how each benchmark changed and fails on any regression"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown of the median")
+    args = parser.parse_args(argv)
+    with open(args.baseline, encoding="utf-8") as baseline, open(args.current, encoding="utf-8") as current:
+        baseline, current = json.load(baseline), json.load(current)
+    print(f"baseline {baseline['meta']['commit']}, current {current['meta']['commit']}")
+    rows = compare(baseline, current, args.tolerance)
+    for row in rows:
+        flag = "SLOWER" if row["regression"] else ""
+        print(
+            f"{row['size']:>8} {row['name']:<60} {row['baseline_ms']:>10.3f} "
+            f"{row['current_ms']:>10.3f} {row['ratio']:>7.2f}x {flag}"
+        )
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{len(rows)} benchmarks compared, {regressions} slower by more than {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+Gunicorn Configuration
+
+Gunicorn loads this file from the working directory. It prepares the
+shared folder where every worker writes its Prometheus samples, so that
+/metrics can add them up, and cleans up after workers that exit.
+"""
+import os
+import shutil
+
+# prometheus_client picks its storage when it is imported, and the
+# workers inherit it, so this has to come first
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+# pylint: disable=wrong-import-position
+from prometheus_client import multiprocess  # noqa: E402
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Starts every run with an empty metrics folder"""
+    folder = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder, exist_ok=True)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live samples of a worker that exited"""
+    multiprocess.mark_process_dead(worker.pid)
@@ -9,7 +9,10 @@ from flask import Flask
 from flask_restx import Api
 from service import config
 from service.common import log_handlers
+from service.common.startup import StartupTimer
 
+# Time every phase of bringing this worker up
+startup = StartupTimer()
 
 # Create Flask application
 app = Flask(__name__)
@@ -31,11 +34,14 @@ api = Api(
 )
 
 # Dependencies require we import the routes AFTER the Flask app is created
-# pylint: disable=wrong-import-position, wrong-import-order, cyclic-import
-from service import routes, models  # noqa: E402, E261
+with startup.phase("routes"):
+    # pylint: disable=wrong-import-position, wrong-import-order, cyclic-import
+    from service import routes, models  # noqa: E402, E261
 
-# pylint: disable=wrong-import-position
-from service.common import error_handlers, cli_commands  # noqa: F401, E402
+    # pylint: disable=wrong-import-position
+    from service.common import (  # noqa: F401, E402
+        error_handlers, cli_commands, compression, like_buffer, metrics, replica, sql_timing
+    )
 
 # Set up logging for production
 log_handlers.init_logging(app, "gunicorn.error")
@@ -45,10 +51,17 @@ app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
 app.logger.info(70 * "*")
 
 try:
-    models.init_db(app)  # make our SQLAlchemy tables
+    with startup.phase("database"):
+        models.init_db(app)  # make our SQLAlchemy tables
 except Exception as error:  # pylint: disable=broad-except
     app.logger.critical("%s: Cannot continue", error)
     # gunicorn requires exit code 4 to stop spawning workers when they die
     sys.exit(4)
 
-app.logger.info("Service initialized!")
+like_buffer.init_likes(app)
+replica.init_replica(app)
+sql_timing.init_sql_timing(app)
+compression.init_compression(app)
+metrics.init_metrics(app)
+
+app.logger.info("Service initialized in %.3fs: %s", startup.ready(), startup.summary())
@@ -0,0 +1,327 @@
+"""
+ASGI Application
+
+An optional asyncio mode of the service, for workers that should keep
+serving reads while some of them wait on a slow query:
+
+  gunicorn -k uvicorn.workers.UvicornWorker service.asgi:app
+
+GET /api/products and GET /api/products/{id} are served by coroutines
+that read through an async SQLAlchemy engine. They run in a Flask
+request context and answer through the same parsers, helpers and
+before/after request hooks as the Flask views, so the API is the same
+in both modes. Only the database reads wait on the event loop: building
+the response, which encodes, hashes and compresses it, runs on a pool of
+GUNICORN_THREADS threads, as does every other request and the NDJSON
+stream, which are handed to the Flask app.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.wrappers import Request
+from service import app as flask_app
+from service.common.replica import PRIMARY_ONLY
+from service.models import Product
+from service.routes import (
+    NDJSON,
+    ProductCollection,
+    ProductResource,
+    field_args,
+    list_filters,
+    page_limit,
+    page_response,
+    parse_fields,
+    product_args,
+    product_response,
+    projected_columns,
+)
+
+# The async drivers of the databases that have one
+ASYNC_DRIVERS = {"postgresql": "psycopg", "sqlite": "aiosqlite"}
+
+# Request bodies larger than this many bytes are spooled to a file
+MAX_MEMORY_BODY = 65536
+
+# The threads that run the Flask app and build the responses of the
+# coroutine views, so that CPU-bound work never blocks the event loop
+executor = ThreadPoolExecutor(max_workers=flask_app.config["GUNICORN_THREADS"], thread_name_prefix="wsgi")
+
+
+async def in_thread(func, *args):
+    """Runs a function on the executor, in the request and app context of the caller"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(context.run, func, *args))
+
+
+######################################################################
+#  A S Y N C   D A T A B A S E
+######################################################################
+def async_url(uri: str):
+    """Returns the URL of a database with its async driver"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS.get(backend, url.get_driver_name())}")
+
+
+class AsyncDatabase:
+    """The async engine of this worker, which is made on first use"""
+
+    def __init__(self, application):
+        self.app = application
+        self.engine = None
+        self.sessions = None
+
+    def connect(self):
+        """Makes the engine from the same settings as the sync one"""
+        config = self.app.config
+        url = async_url(config["SQLALCHEMY_DATABASE_URI"])
+        options = {}
+        if url.get_backend_name() != "sqlite":
+            options = {
+                "pool_size": config["ASYNC_DB_POOL_SIZE"],
+                "max_overflow": config["ASYNC_DB_MAX_OVERFLOW"],
+                "pool_timeout": config["DB_POOL_TIMEOUT"],
+                "pool_recycle": config["DB_POOL_RECYCLE"],
+                "pool_pre_ping": config["DB_POOL_PRE_PING"],
+            }
+        self.engine = create_async_engine(url, **options)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    @asynccontextmanager
+    async def session(self):
+        """Opens an AsyncSession for one request"""
+        if self.sessions is None:
+            self.connect()
+        async with self.sessions() as session:
+            yield session
+
+    async def dispose(self):
+        """Closes every pooled connection of the event loop that is ending"""
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = self.sessions = None
+
+
+database = AsyncDatabase(flask_app)
+
+
+######################################################################
+#  A S Y N C   V I E W S
+######################################################################
+def product_key(product_id):
+    """Returns the integer id of a Product, or None for one that cannot exist"""
+    try:
+        return int(product_id)
+    except ValueError:
+        return None
+
+
+async def get_product(session, product_id):
+    """Retrieves a single Product, as ProductResource.get does
+
+    Returns the function that builds the response, which dispatch runs
+    off the event loop.
+    """
+    flask_app.logger.info("Request to Retrieve a product with id [%s]", product_id)
+    field_names = parse_fields(field_args.parse_args()["fields"])
+    columns = projected_columns(field_names)
+    key = product_key(product_id)
+    product = None
+    if key is not None and field_names:
+        product = await Product.find_columns_async(session, key, columns)
+    elif key is not None:
+        product = await Product.find_async(session, key)
+    return partial(product_response, product_id, product, field_names, columns)
+
+
+async def list_products(session):
+    """Returns a page of Products, as ProductCollection.get does, like get_product"""
+    flask_app.logger.info("Request to list Products inventory...")
+    args = product_args.parse_args()
+    field_names = parse_fields(args["fields"])
+    columns = projected_columns(field_names, args["sort"])
+    statement = Product.select_by_filters(columns, **list_filters(args))
+    products, next_cursor = await Product.paginate_async(
+        session, statement, sort=args["sort"], limit=page_limit(args), cursor=args["cursor"]
+    )
+    return partial(page_response, products, next_cursor, field_names, columns)
+
+
+# The Resources whose GET is served here, and the coroutines that serve it
+ASYNC_VIEWS = {ProductResource: get_product, ProductCollection: list_products}
+
+
+def async_view(environ):
+    """Finds the coroutine that serves a request, or None to leave it to Flask"""
+    if environ["REQUEST_METHOD"] != "GET":
+        return None, None
+    try:
+        endpoint, args = flask_app.url_map.bind_to_environ(environ).match()  # pylint: disable=unpacking-non-sequence
+    except HTTPException:
+        return None, None
+    view_class = getattr(flask_app.view_functions.get(endpoint), "view_class", None)
+    view = ASYNC_VIEWS.get(view_class)
+    if view is list_products:
+        request = Request(environ)
+        if "stream" in request.args or request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON:
+            return None, None
+    return view, args
+
+
+async def dispatch(view, environ, args):
+    """Runs a coroutine view through the request handling of Flask
+
+    The before request hooks run on the event loop, so the replica probe,
+    a blocking round trip, is skipped: the async engine reads the primary.
+    The response is built and finalized, with the after request hooks
+    that compress it, on the executor.
+    """
+    environ[PRIMARY_ONLY] = True
+    with flask_app.request_context(environ):
+        try:
+            try:
+                response = flask_app.preprocess_request()
+                if response is None:
+                    async with database.session() as session:
+                        respond = await view(session, **args)
+                    response = await in_thread(respond)
+            except Exception as error:  # pylint: disable=broad-except
+                response = flask_app.handle_user_exception(error)
+            return await in_thread(flask_app.finalize_request, response)
+        except Exception as error:  # pylint: disable=broad-except
+            return flask_app.handle_exception(error)
+
+
+######################################################################
+#  A S G I   A P P L I C A T I O N
+######################################################################
+def wsgi_environ(scope, body):
+    """Builds the WSGI environ of an ASGI http scope"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": BytesIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1")
+        if name in ("content-length", "content-type"):
+            key = name.upper().replace("-", "_")
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive, body):
+    """Writes the body of an http request into a file, False on a disconnect"""
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return False
+        body.write(message.get("body", b""))
+        if not message.get("more_body"):
+            body.seek(0)
+            return True
+
+
+def run_wsgi(application, environ, send):
+    """Runs a WSGI app in a pool thread, sending its response as it is made
+
+    send is called on the event loop, and waited for, so a streamed
+    response goes out one chunk at a time.
+    """
+    started = {}
+
+    def start_response(status, headers, exc_info=None):  # pylint: disable=unused-argument
+        started["message"] = {
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [(key.lower().encode("latin1"), value.encode("latin1")) for key, value in headers],
+        }
+
+    result = application(environ, start_response)
+    try:
+        for output in result:
+            if output:
+                send(started.pop("message", None))
+                send({"type": "http.response.body", "body": output, "more_body": True})
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    send(started.pop("message", None))
+    send({"type": "http.response.body"})
+
+
+class ProductsApp:
+    """Serves the product reads with coroutines and hands the rest to Flask"""
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope {scope['type']}")
+        environ = wsgi_environ(scope, BytesIO())
+        view, args = async_view(environ)
+        if view:
+            response = await dispatch(view, environ, args)
+            await send_response(send, response)
+            return
+        with SpooledTemporaryFile(max_size=MAX_MEMORY_BODY) as body:
+            if not await read_body(receive, body):
+                return
+            environ["wsgi.input"] = body
+            loop = asyncio.get_running_loop()
+
+            def send_from_thread(message):
+                if message is not None:
+                    asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            await in_thread(run_wsgi, self.wsgi_application, environ, send_from_thread)
+
+    @staticmethod
+    async def lifespan(receive, send):
+        """Closes the async engine when the worker shuts down"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await database.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def send_response(send, response):
+    """Sends a Flask response over ASGI"""
+    headers = [(key.lower().encode("latin1"), value.encode("latin1")) for key, value in response.headers.items()]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+
+app = ProductsApp(flask_app)
@@ -1,8 +1,30 @@
 """
 Flask CLI Command Extensions
 """
+import csv
+import gzip
+import json
+import os
+import time
+import click
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateIndex
 from service import app
-from service.models import db
+from service.common.compression import precompress_static
+from service.models import db, Product, DataValidationError, SEARCH_INDEX, SEARCH_INDEX_DDL
+
+# Representative queries whose plans db-migrate reports
+PLAN_QUERIES = {
+    "name": lambda: Product.find_by_name("Coke"),
+    "category+available": lambda: Product.find_by_filters(
+        category="beverage", available=True
+    ),
+    "available": lambda: Product.find_by_availability(True),
+    "enabled by price": lambda: Product.keyset(
+        Product.find_by_filters(disable=False), sort="price"
+    ),
+}
 
 
 ######################################################################
@@ -19,3 +41,278 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to apply new tables and indexes without losing data
+# Usage:
+#   flask db-migrate
+######################################################################
+@app.cli.command("db-migrate")
+def db_migrate():
+    """
+    Creates any missing tables and indexes on a live database. On
+    PostgreSQL the indexes are built CONCURRENTLY so writes keep flowing.
+    """
+    db.create_all()  # only creates the tables that do not exist yet
+    click.echo("Query plans before migration:")
+    echo_query_plans()
+
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        table = Product.__table__
+        existing = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                click.echo(f"Index {index.name} already exists")
+                continue
+            ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+            if conn.dialect.name == "postgresql":
+                ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+            click.echo(f"Creating index {index.name}")
+            conn.execute(text(ddl))
+        if conn.dialect.name == "postgresql" and SEARCH_INDEX not in existing:
+            click.echo(f"Creating index {SEARCH_INDEX}")
+            conn.execute(text(SEARCH_INDEX_DDL.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)))
+
+    click.echo("Query plans after migration:")
+    echo_query_plans()
+
+
+def echo_query_plans():
+    """Prints the database query plan of each of the PLAN_QUERIES"""
+    dialect = db.engine.dialect
+    explain = "EXPLAIN QUERY PLAN" if dialect.name == "sqlite" else "EXPLAIN"
+    for label, query in PLAN_QUERIES.items():
+        statement = query().statement.compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True}
+        )
+        click.echo(f"  [{label}]")
+        for row in db.session.execute(text(f"{explain} {statement}")):
+            click.echo(f"    {row[-1]}")
+    db.session.rollback()
+
+
+######################################################################
+# Command to bulk load a catalog from a file
+# Usage:
+#   flask products-import catalog.csv --checkpoint catalog.ckpt
+######################################################################
+@app.cli.command("products-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["csv", "ndjson"]),
+    help="File format, taken from the file extension by default.",
+)
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows per commit.")
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    help="File that records the committed rows so an import can resume.",
+)
+@click.option("--copy", is_flag=True, help="Load the rows with PostgreSQL COPY.")
+def products_import(path, file_format, chunk_size, checkpoint, copy):
+    """
+    Streams Products from a CSV or NDJSON file into the database,
+    committing one chunk at a time
+    """
+    file_format = file_format or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    done = read_checkpoint(checkpoint, path)
+    if done:
+        click.echo(f"Resuming after row {done}")
+    load = Product.bulk_copy if copy else Product.bulk_insert
+
+    start = time.perf_counter()
+    imported = rejected = 0
+    chunk = []
+    for row_number, raw in read_records(path, file_format, skip=done):
+        try:
+            chunk.append(Product().deserialize(parse_record(raw, file_format)))
+        except (DataValidationError, ValueError) as error:
+            rejected += 1
+            click.echo(f"Row {row_number}: {error}", err=True)
+        if len(chunk) == chunk_size:
+            imported += len(load_chunk(load, chunk))
+            write_checkpoint(checkpoint, path, row_number)
+            click.echo(f"Imported {imported} rows ({rejected} rejected) {rate(imported, start)}")
+            chunk = []
+        done = row_number
+    imported += len(load_chunk(load, chunk))
+    write_checkpoint(checkpoint, path, done)
+    click.echo(
+        f"Imported {imported} rows, rejected {rejected} rows in "
+        f"{time.perf_counter() - start:.1f}s {rate(imported, start)}"
+    )
+
+
+def read_records(path, file_format, skip=0):
+    """Yields (row number, unparsed row) for each data row of a file after skip
+
+    The rows are parsed by parse_record, so that a bad one is rejected
+    with its row number rather than stopping the import.
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            rows = csv.DictReader(file)
+        else:
+            rows = (line for line in file if line.strip())
+        for row_number, row in enumerate(rows, start=1):
+            if row_number > skip:
+                yield row_number, row
+
+
+def parse_record(row, file_format):
+    """Turns a CSV row or an NDJSON line into the record deserialize expects
+
+    Raises ValueError for a row that cannot be parsed.
+    """
+    if file_format == "csv":
+        return coerce_csv_row(row)
+    return json.loads(row)
+
+
+def coerce_csv_row(row):
+    """Converts the text fields of a CSV row to the types deserialize expects"""
+    record = dict(row)
+    for key, convert in (("price", float), ("inventory", int), ("like", int)):
+        value = row.get(key)
+        if value is None:
+            continue  # let deserialize report the missing field
+        if value == "":
+            record[key] = None
+            continue
+        try:
+            record[key] = convert(value)
+        except ValueError as error:
+            raise ValueError(f"Invalid {key}: {value!r}") from error
+    for key in ("available", "disable"):
+        if str(row.get(key)).lower() in ("true", "1"):
+            record[key] = True
+        elif str(row.get(key)).lower() in ("false", "0"):
+            record[key] = False
+    return record
+
+
+def load_chunk(load, chunk):
+    """Loads and commits one chunk of Products, stopping on a database error"""
+    if chunk:
+        try:
+            load(chunk)
+        except (DataValidationError, SQLAlchemyError) as error:
+            db.session.rollback()
+            raise click.ClickException(f"Chunk rejected, nothing after the checkpoint was saved: {error}")
+    return chunk
+
+
+def rate(rows, start):
+    """Formats a rows per second figure"""
+    return f"({rows / max(time.perf_counter() - start, 1e-9):.0f} rows/s)"
+
+
+def read_checkpoint(checkpoint, path):
+    """Returns how many rows of the file an earlier import committed"""
+    if not checkpoint or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint, encoding="utf-8") as file:
+        state = json.load(file)
+    if state.get("path") != os.path.abspath(path):
+        raise click.ClickException(f"Checkpoint {checkpoint} is for {state.get('path')}")
+    return state["rows"]
+
+
+def write_checkpoint(checkpoint, path, rows):
+    """Records that the first rows of the file are committed"""
+    if not checkpoint:
+        return
+    with open(checkpoint + ".tmp", "w", encoding="utf-8") as file:
+        json.dump({"path": os.path.abspath(path), "rows": rows}, file)
+    os.replace(checkpoint + ".tmp", checkpoint)
+
+
+######################################################################
+# Command to dump a point-in-time copy of the catalog
+# Usage:
+#   flask products-export catalog.ndjson.gz
+######################################################################
+@app.cli.command("products-export")
+@click.argument("path")
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["csv", "ndjson"]),
+    help="File format, taken from the file extension by default.",
+)
+@click.option("--gzip", "compress", is_flag=True, help="Gzip the output (default for .gz).")
+@click.option("--batch-size", default=5000, show_default=True, help="Rows per fetch.")
+def products_export(path, file_format, compress, batch_size):
+    """
+    Streams every Product to a CSV or NDJSON file, or - for stdout, from
+    one consistent snapshot of the database
+    """
+    name = path.lower().removesuffix(".gz")
+    file_format = file_format or ("csv" if name.endswith(".csv") else "ndjson")
+    compress = compress or path.lower().endswith(".gz")
+
+    start = time.perf_counter()
+    exported = 0
+    with open_export(path, compress) as file:
+        writer = csv.DictWriter(file, fieldnames=list(Product.__table__.columns.keys()))
+        if file_format == "csv":
+            writer.writeheader()
+        for row in snapshot_rows(batch_size):
+            data = Product.serialize_row(row)
+            if file_format == "csv":
+                writer.writerow(data)
+            else:
+                file.write(json.dumps(data) + "\n")
+            exported += 1
+    click.echo(
+        f"Exported {exported} rows in {time.perf_counter() - start:.1f}s "
+        f"{rate(exported, start)}",
+        err=True,
+    )
+
+
+def snapshot_rows(batch_size):
+    """
+    Yields every Product row from a server-side cursor inside a single
+    REPEATABLE READ (SERIALIZABLE on SQLite) transaction
+    """
+    isolation = "REPEATABLE READ" if db.engine.dialect.name == "postgresql" else "SERIALIZABLE"
+    table = Product.__table__
+    with db.engine.connect().execution_options(
+        isolation_level=isolation, yield_per=batch_size
+    ) as conn:
+        with conn.begin():
+            yield from conn.execute(select(table).order_by(table.c.id))
+
+
+def open_export(path, compress):
+    """Opens the export destination for writing text"""
+    if path == "-":
+        stream = click.get_binary_stream("stdout")
+        if compress:
+            return gzip.open(stream, "wt", encoding="utf-8", newline="")
+        return click.open_file("-", "w")
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+######################################################################
+# Command to compress the static files ahead of time
+# Usage:
+#   flask static-compress
+######################################################################
+@app.cli.command("static-compress")
+@click.option("--min-size", type=int, default=None, help="Skip files smaller than this many bytes")
+def static_compress(min_size):
+    """
+    Writes a compressed copy next to each static file in every coding this
+    process supports, so they are served without compressing per request
+    """
+    written = precompress_static(app, min_size)
+    for path, encoding, size, compressed in written:
+        click.echo(f"{os.path.relpath(path, app.static_folder)}: {size} -> {compressed} bytes ({encoding})")
+    click.echo(f"Wrote {len(written)} compressed files")
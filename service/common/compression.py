@@ -0,0 +1,202 @@
+"""
+Response Compression
+
+This module negotiates a content coding from Accept-Encoding and
+compresses responses with it, chunk by chunk when they are streamed.
+Static files are served from copies compressed ahead of time by the
+static-compress command. Brotli and zstd are used when the brotli and
+zstandard packages are installed, gzip is always available.
+"""
+import os
+import zlib
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Media types worth compressing besides text/*
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "image/svg+xml",
+)
+
+# File suffix of the precompressed copy of a static file in each coding
+STATIC_SUFFIXES = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+# Fast levels for responses, the best levels for static files
+DYNAMIC_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+STATIC_LEVELS = {"br": 11, "zstd": 19, "gzip": 9}
+
+
+def available_encodings(preferred) -> list:
+    """Returns the preferred content codings this process can produce"""
+    installed = {"br": brotli, "zstd": zstandard, "gzip": zlib}
+    return [encoding for encoding in preferred if installed.get(encoding)]
+
+
+class Compressor:
+    """Incrementally compresses a body in one content coding"""
+
+    def __init__(self, encoding: str, level: int = None):
+        self.encoding = encoding
+        level = DYNAMIC_LEVELS[encoding] if level is None else level
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """Compresses a chunk, flushing it to the output if asked to"""
+        if self.encoding == "br":
+            return self._compressor.process(data) + (self._compressor.flush() if flush else b"")
+        chunk = self._compressor.compress(data)
+        if flush and self.encoding == "zstd":
+            chunk += self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        elif flush:
+            chunk += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return chunk
+
+    def finish(self) -> bytes:
+        """Returns the end of the compressed body"""
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    """Compresses a whole body in one content coding"""
+    compressor = Compressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_chunks(chunks, compressor):
+    """Compresses a streamed body, flushing every chunk so it is sent at once"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield compressor.compress(chunk, flush=True)
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def is_compressible(response) -> bool:
+    """Checks whether a response is worth compressing"""
+    return (
+        200 <= response.status_code < 300
+        and response.status_code not in (204, 206)
+        and "Content-Encoding" not in response.headers
+        and not response.direct_passthrough
+        and (response.mimetype.startswith("text/") or response.mimetype in COMPRESSIBLE_TYPES)
+    )
+
+
+def weaken_etag(response):
+    """Marks a strong ETag as weak, the compressed bytes differ per coding"""
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def serve_precompressed(app, response):
+    """Swaps a static file for its precompressed copy if the client accepts one
+
+    A copy is only used while it is newer than the file it was made from.
+    """
+    filename = (request.view_args or {}).get("filename")
+    source = safe_join(app.static_folder, filename) if filename else None
+    if response.status_code != 200 or not source or not os.path.isfile(source):
+        return response
+    response.vary.add("Accept-Encoding")
+    candidates = [
+        encoding
+        for encoding in available_encodings(app.config["COMPRESS_ENCODINGS"])
+        if os.path.isfile(source + STATIC_SUFFIXES[encoding])
+        and os.path.getmtime(source + STATIC_SUFFIXES[encoding]) >= os.path.getmtime(source)
+    ]
+    encoding = request.accept_encodings.best_match(candidates)
+    if not encoding:
+        return response
+    compressed = send_from_directory(
+        app.static_folder, filename + STATIC_SUFFIXES[encoding], mimetype=response.mimetype
+    )
+    response.close()
+    compressed.headers["Content-Encoding"] = encoding
+    compressed.vary.add("Accept-Encoding")
+    return compressed
+
+
+def precompress_static(app, min_size: int = None):
+    """Writes compressed copies of the static files that are out of date
+
+    Returns:
+        a list of (path, coding, original size, compressed size) tuples
+        of the copies that were written
+    """
+    min_size = app.config["COMPRESS_MIN_SIZE"] if min_size is None else min_size
+    suffixes = tuple(STATIC_SUFFIXES.values())
+    written = []
+    for folder, _, names in os.walk(app.static_folder):
+        for name in sorted(names):
+            source = os.path.join(folder, name)
+            if name.endswith(suffixes) or os.path.getsize(source) < min_size:
+                continue
+            if not name.endswith((".html", ".css", ".js", ".json", ".svg", ".txt", ".map")):
+                continue
+            with open(source, "rb") as file:
+                data = None
+                for encoding in available_encodings(app.config["COMPRESS_ENCODINGS"]):
+                    target = source + STATIC_SUFFIXES[encoding]
+                    if os.path.isfile(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                        continue
+                    data = file.read() if data is None else data
+                    body = compress(data, encoding, STATIC_LEVELS[encoding])
+                    with open(target, "wb") as output:
+                        output.write(body)
+                    written.append((target, encoding, len(data), len(body)))
+    return written
+
+
+def init_compression(app):
+    """Compresses the responses of the app in the coding the client prefers"""
+
+    @app.after_request
+    def compress_response(response):  # pylint: disable=unused-variable
+        if request.endpoint == "static":
+            return serve_precompressed(app, response)
+        if not is_compressible(response) and response.status_code != 304:
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(
+            available_encodings(app.config["COMPRESS_ENCODINGS"])
+        )
+        if not encoding:
+            return response
+        weaken_etag(response)
+        if response.status_code == 304:
+            return response
+        if response.is_streamed:
+            response.response = compress_chunks(response.response, Compressor(encoding))
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+                return response
+            response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
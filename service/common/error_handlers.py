@@ -19,7 +19,7 @@ Module: error_handlers
 """
 from flask import jsonify
 from service.models import DataValidationError
-from service import app
+from service import app, api
 from . import status
 
 
@@ -32,6 +32,18 @@ def request_validation_error(error):
     return bad_request(error)
 
 
+@api.errorhandler(DataValidationError)
+def api_validation_error(error):
+    """Handles Value Errors from bad data in the REST API
+
+    Unless exceptions propagate, as they do in testing, flask-restx
+    answers them with 500 before the app's error handlers see them.
+    """
+    message = str(error)
+    app.logger.warning(message)
+    return {"status": status.HTTP_400_BAD_REQUEST, "error": "Bad Request", "message": message}, status.HTTP_400_BAD_REQUEST
+
+
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
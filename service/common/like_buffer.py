@@ -0,0 +1,112 @@
+"""
+Like Buffer
+
+This module accumulates likes in memory and writes them behind to the
+database, so a trending Product does not turn into a hot row lock
+"""
+import atexit
+import logging
+import threading
+from sqlalchemy.exc import SQLAlchemyError
+from service.models import Product
+
+logger = logging.getLogger("flask.app")
+
+
+class LikeBuffer:
+    """Sums likes per Product and flushes them in periodic batches"""
+
+    def __init__(self):
+        self.app = None
+        self.interval = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._inflight = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, product_id: int, count: int = 1):
+        """Records likes for a Product, flushing at once if write-behind is off"""
+        with self._lock:
+            self._pending[product_id] = self._pending.get(product_id, 0) + count
+        if self.interval <= 0:
+            self.flush()
+
+    def pending(self, product_id: int) -> int:
+        """Returns the likes of a Product that are not in the database yet"""
+        with self._lock:
+            return self._pending.get(product_id, 0) + self._inflight.get(product_id, 0)
+
+    def discard(self, product_id: int):
+        """Drops the buffered likes of a Product whose like count is set outright
+
+        The count being set already includes any flush in flight, so that
+        flush is waited for rather than dropped.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._pending.pop(product_id, None)
+
+    def clear(self):
+        """Discards every buffered like"""
+        with self._lock:
+            self._pending = {}
+
+    def flush(self):
+        """Writes the summed likes to the database in one batched UPDATE
+
+        Flushes run one at a time, so the likes in flight are only ever
+        those of one batch.
+        """
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._pending = self._pending, {}
+                self._inflight = deltas
+            if not deltas:
+                return
+            failed = {}
+            try:
+                with self.app.app_context():
+                    Product.add_likes(deltas)
+            except SQLAlchemyError as error:
+                logger.error("Could not flush likes, will retry: %s", error)
+                failed = deltas
+            finally:
+                # moved back in the same step, so they are never counted twice
+                with self._lock:
+                    for product_id, count in failed.items():
+                        self._pending[product_id] = self._pending.get(product_id, 0) + count
+                    self._inflight = {}
+
+    def start(self, app):
+        """Starts flushing every LIKE_FLUSH_INTERVAL seconds until shutdown"""
+        self.app = app
+        self.interval = app.config["LIKE_FLUSH_INTERVAL"]
+        atexit.register(self.stop)
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="like-buffer", daemon=True
+            )
+            self._thread.start()
+        logger.info("Like buffer flushing every %s seconds", self.interval)
+
+    def stop(self):
+        """Stops the background flush and writes out what is left"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+
+likes = LikeBuffer()
+
+
+def init_likes(app):
+    """Starts the write-behind like buffer for the app"""
+    likes.start(app)
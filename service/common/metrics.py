@@ -0,0 +1,77 @@
+"""
+Prometheus Metrics
+
+This module counts the requests of each flask-restx resource, times
+them and the database work they do, and renders the text exposition
+format for /metrics. When PROMETHEUS_MULTIPROC_DIR is set, as the
+gunicorn.conf.py does, every worker writes its samples there and
+/metrics adds them up across all of the workers.
+"""
+import os
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from service.common import sql_timing
+
+LABELS = ("resource", "method")
+
+REQUESTS = Counter(
+    "http_requests_total", "Requests handled, by resource, method and status", LABELS + ("status",)
+)
+ERRORS = Counter(
+    "http_request_errors_total", "Requests that ended with a 5xx status, by resource and method", LABELS
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to handle a request, by resource and method", LABELS
+)
+DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Time spent in the database per request, by resource and method",
+    LABELS,
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, float("inf")),
+)
+
+
+def resource_name(app) -> str:
+    """Names what handled the request: the Resource class, the view or unmatched"""
+    if request.endpoint is None:
+        return "unmatched"
+    view = app.view_functions.get(request.endpoint)
+    view_class = getattr(view, "view_class", None)
+    return view_class.__name__ if view_class else request.endpoint
+
+
+def exposition():
+    """Renders every metric, across all of the workers if there are several"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_metrics(app):
+    """Records the count, latency and database time of every request
+
+    The request is timed by the sql_timing hooks, so init_sql_timing()
+    must be called first
+    """
+
+    @app.after_request
+    def record_request(response):  # pylint: disable=unused-variable
+        if "request_start" not in g:
+            return response
+        labels = (resource_name(app), request.method)
+        REQUESTS.labels(*labels, response.status_code).inc()
+        if response.status_code >= 500:
+            ERRORS.labels(*labels).inc()
+        LATENCY.labels(*labels).observe(sql_timing.request_elapsed())
+        DB_TIME.labels(*labels).observe(sql_timing.request_totals()[1])
+        return response
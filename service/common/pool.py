@@ -0,0 +1,63 @@
+"""
+Connection Pool Telemetry
+
+This module contains a QueuePool that measures how long requests wait
+to check out a database connection, and a helper that reports the live
+state of an engine's pool
+"""
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that counts checkouts, timeouts and the time spent waiting"""
+
+    def __init__(self, creator, **kw):
+        super().__init__(creator, **kw)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def pool_stats(engine) -> dict:
+    """Returns the live state of the connection pool of an engine"""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__, "status": pool.status()}
+    stats = {
+        "class": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            wait_seconds=round(pool.wait_seconds, 6),
+            max_wait_seconds=round(pool.max_wait_seconds, 6),
+            average_wait_seconds=round(pool.wait_seconds / pool.checkouts, 6) if pool.checkouts else 0.0,
+        )
+    return stats
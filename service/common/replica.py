@@ -0,0 +1,201 @@
+"""
+Read Replica Routing
+
+This module sends the SELECTs of GET and HEAD requests to a read replica
+when DATABASE_REPLICA_URI is set, and everything else to the primary.
+A client that has just written is pinned to the primary by a short-lived
+cookie so that it reads its own writes, and the reads fall back to the
+primary while the replica is down or lagging too far behind.
+"""
+import logging
+import threading
+import time
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger("flask.app")
+
+# Requests that only read, and may be served from the replica
+READ_METHODS = ("GET", "HEAD")
+
+# Set in the WSGI environ of a request that never reads through the
+# routing session, such as a coroutine view of the ASGI mode, so that it
+# does not pay for a replica probe it has no use for
+PRIMARY_ONLY = "service.primary_only"
+
+# Seconds the replica is behind the primary, 0 when it is caught up or is
+# not a standby at all (for example a second database in development)
+PG_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaRouter:
+    """The replica engine of this worker and whether it is fit to read from"""
+
+    def __init__(self):
+        self.engine = None
+        self.sticky_seconds = 0
+        self.cookie = "read_primary"
+        self.check_interval = 0
+        self.max_lag = 0
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    def configure(self, uri, options=None, **settings):
+        """Connects to the replica at uri, or turns routing off if uri is empty"""
+        self.dispose()
+        self.sticky_seconds = settings.get("sticky_seconds", 5)
+        self.cookie = settings.get("cookie", "read_primary")
+        self.check_interval = settings.get("check_interval", 5.0)
+        self.max_lag = settings.get("max_lag", 10.0)
+        if not uri:
+            return
+        self.engine = create_engine(uri, **(options or {}))
+        event.listen(self.engine, "handle_error", self.on_error)
+        self.healthy = True
+        self.checked_at = None
+
+    def dispose(self):
+        """Closes the replica's connections and turns routing off"""
+        if self.engine is not None:
+            self.engine.dispose()
+        self.engine = None
+        self.healthy = False
+        self.lag = None
+
+    def check(self) -> bool:
+        """Returns whether the replica can serve reads, probing it now and then
+
+        The probe runs at most once per check_interval in each worker, so
+        an unhealthy replica gets another chance once the interval is up.
+        """
+        if self.engine is None:
+            return False
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.check_interval:
+            return self.healthy
+        if not self._lock.acquire(blocking=False):
+            return self.healthy  # another thread is probing already
+        try:
+            self.checked_at = now
+            self.healthy, self.lag = self.probe()
+        finally:
+            self._lock.release()
+        return self.healthy
+
+    def probe(self) -> tuple:
+        """Runs one round trip on the replica and returns (healthy, lag)"""
+        try:
+            with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    lag = float(conn.execute(PG_LAG_QUERY).scalar() or 0)
+                else:
+                    lag = float(conn.execute(text("SELECT 0")).scalar())
+        except SQLAlchemyError as error:
+            logger.warning("Read replica is unavailable, reading from the primary: %s", error)
+            return False, None
+        if lag > self.max_lag:
+            logger.warning("Read replica is %.1fs behind, reading from the primary", lag)
+            return False, lag
+        return True, lag
+
+    def on_error(self, context):
+        """Stops reading from a replica whose connections are failing"""
+        if context.is_disconnect or context.connection is None:
+            logger.warning("Lost the read replica: %s", context.original_exception)
+            self.healthy = False
+            self.checked_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """Returns the state of the replica for the health check"""
+        if self.engine is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "sticky_seconds": self.sticky_seconds,
+        }
+
+
+router = ReplicaRouter()
+
+
+def reads_from_replica() -> bool:
+    """Returns whether the current request has been routed to the replica"""
+    return has_app_context() and g.get("read_replica", False)
+
+
+def pinned_to_primary() -> bool:
+    """Returns whether the current client is reading its own writes"""
+    return has_app_context() and g.get("pinned_to_primary", False)
+
+
+class RoutingSession(Session):
+    """A Session that runs the SELECTs of routed requests on the replica
+
+    Flushes and every other statement stay on the primary, so a request
+    that writes after all still writes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):  # pylint: disable=arguments-differ
+        if (
+            bind is None
+            and not self._flushing
+            and clause is not None
+            and clause.is_select
+            and router.engine is not None
+            and reads_from_replica()
+        ):
+            return router.engine
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+
+######################################################################
+#  F L A S K   H O O K S
+######################################################################
+def init_replica(app):
+    """Connects to the read replica and routes the reads of every request"""
+    options = {}
+    uri = app.config["DATABASE_REPLICA_URI"]
+    if uri and not uri.startswith("sqlite"):
+        options = dict(app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+    router.configure(
+        uri,
+        options,
+        sticky_seconds=app.config["REPLICA_STICKY_SECONDS"],
+        cookie=app.config["REPLICA_STICKY_COOKIE"],
+        check_interval=app.config["REPLICA_CHECK_INTERVAL"],
+        max_lag=app.config["REPLICA_MAX_LAG_SECONDS"],
+    )
+    if router.engine is not None:
+        logger.info("Reading from the replica at %s", router.engine.url)
+
+    @app.before_request
+    def route_reads():  # pylint: disable=unused-variable
+        g.pinned_to_primary = router.engine is not None and router.cookie in request.cookies
+        g.read_replica = (
+            request.method in READ_METHODS
+            and not g.pinned_to_primary
+            and not request.environ.get(PRIMARY_ONLY)
+            and router.check()
+        )
+
+    @app.after_request
+    def stick_to_primary(response):  # pylint: disable=unused-variable
+        if router.engine is not None and request.method not in READ_METHODS and response.status_code < 400:
+            response.set_cookie(
+                router.cookie, "1", max_age=router.sticky_seconds, httponly=True, samesite="Lax"
+            )
+        return response
+
+    @app.teardown_request
+    def forget_route(_error):  # pylint: disable=unused-variable
+        g.pop("read_replica", None)
+        g.pop("pinned_to_primary", None)
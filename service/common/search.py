@@ -0,0 +1,133 @@
+"""
+Search Index
+
+This module contains the tokenizer of product search and a thread-safe
+in-process inverted index, which serves search on databases that have
+no full-text index of their own, such as SQLite in development and
+tests. It only sees the writes of its own process.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+# Words are runs of letters and digits, compared in lower case
+WORD = re.compile(r"\w+")
+
+# Score of a query word that matches a whole indexed word, and of one
+# that is only the start of it
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.5
+
+
+def tokenize(text) -> list:
+    """Splits text into its distinct lower case words, in order"""
+    return list(dict.fromkeys(WORD.findall((text or "").lower())))
+
+
+class SearchIndex:
+    """Maps the words of every document to the ids of the documents"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+        self._version = 0
+        self.ready = False
+
+    def __len__(self):
+        return len(self._documents)
+
+    def build(self, load):
+        """Replaces the whole index with the (id, text...) documents of load()
+
+        A document that is added or removed while load() reads them leaves
+        the index not ready, so the next search builds it again.
+        """
+        with self._build_lock:
+            with self._lock:
+                version = self._version
+            postings = {}
+            words = {}
+            for doc_id, *texts in load():
+                words[doc_id] = tokenize(" ".join(text or "" for text in texts))
+                for word in words[doc_id]:
+                    postings.setdefault(word, set()).add(doc_id)
+            with self._lock:
+                self._postings = postings
+                self._vocabulary = sorted(postings)
+                self._documents = words
+                self.ready = self._version == version
+
+    def add(self, doc_id, *texts):
+        """Indexes a document, replacing the one with the same id
+
+        Until build() has run the index is not kept at all, so it costs
+        nothing where search is served by the database instead.
+        """
+        with self._lock:
+            self._version += 1
+            if not self.ready:
+                return
+            self._remove(doc_id)
+            words = tokenize(" ".join(text or "" for text in texts))
+            self._documents[doc_id] = words
+            for word in words:
+                if word not in self._postings:
+                    self._postings[word] = set()
+                    insort(self._vocabulary, word)
+                self._postings[word].add(doc_id)
+
+    def remove(self, *doc_ids):
+        """Drops documents from the index"""
+        with self._lock:
+            self._version += 1
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def invalidate(self):
+        """Marks the index as out of date after writes it could not follow"""
+        with self._lock:
+            self._version += 1
+            self.ready = False
+
+    def _remove(self, doc_id):
+        for word in self._documents.pop(doc_id, ()):
+            postings = self._postings[word]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[word]
+                del self._vocabulary[bisect_left(self._vocabulary, word)]
+
+    def search(self, words, limit=None) -> list:
+        """Returns the ids of the documents that match every word, best first
+
+        A query word matches an indexed word that it is the start of, and
+        scores more when it is the whole word. Ties go to the lowest id.
+        With a limit only that many of the best ids are returned.
+        """
+        if not words:
+            return []
+        with self._lock:
+            scores = None
+            for query_word in words:
+                matches = {}
+                position = bisect_left(self._vocabulary, query_word)
+                while position < len(self._vocabulary) and self._vocabulary[position].startswith(query_word):
+                    word = self._vocabulary[position]
+                    position += 1
+                    score = EXACT_SCORE if word == query_word else PREFIX_SCORE
+                    for doc_id in self._postings[word]:
+                        if matches.get(doc_id, 0) < score:
+                            matches[doc_id] = score
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {doc_id: scores[doc_id] + score for doc_id, score in matches.items() if doc_id in scores}
+                if not scores:
+                    return []
+        if limit is not None:
+            return heapq.nsmallest(limit, scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
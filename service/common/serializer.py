@@ -0,0 +1,27 @@
+"""
+JSON Serializer
+
+This module encodes response bodies straight to JSON bytes, through
+orjson when it is installed and the standard json module otherwise
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(data, encoder: str = None) -> bytes:
+    """Encodes data as compact JSON bytes
+
+    Args:
+        data: the lists, dicts and scalars to encode
+        encoder (str): "orjson" or "json" to force an encoder, mostly for
+            benchmarks, the fastest installed one is used by default
+    """
+    if encoder is None:
+        encoder = "orjson" if orjson else "json"
+    if encoder == "orjson":
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
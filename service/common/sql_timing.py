@@ -0,0 +1,107 @@
+"""
+SQL Timing
+
+This module hooks into every SQLAlchemy engine to add up how many
+statements each request runs and how long the database takes for them.
+The totals go into the request log line and the Server-Timing header,
+and any statement slower than SLOW_QUERY_SECONDS is written to the
+slow query log with its parameters and the route that ran it.
+"""
+import logging
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger("flask.app.slow_query")
+
+# Statements that take at least this many seconds are logged, None for none
+SLOW_QUERY = {"seconds": None, "parameters": True}
+
+
+def reset():
+    """Starts timing the current request and counting its statements from zero"""
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_seconds = 0.0
+
+
+def request_totals() -> tuple:
+    """Returns the statement count and database seconds of the current request"""
+    return g.get("sql_count", 0), g.get("sql_seconds", 0.0)
+
+
+def request_elapsed() -> float:
+    """Returns the seconds since the current request started"""
+    return time.perf_counter() - g.get("request_start", time.perf_counter())
+
+
+def server_timing(count: int, sql_seconds: float, elapsed: float) -> str:
+    """Formats the Server-Timing header of a request"""
+    return f'db;dur={sql_seconds * 1000:.2f};desc="{count} statements", app;dur={elapsed * 1000:.2f}'
+
+
+def origin() -> str:
+    """Names the route that ran a statement, or background for other threads"""
+    if not has_request_context():
+        return "background"
+    return f"{request.method} {request.path} ({request.endpoint})"
+
+
+# pylint: disable=too-many-arguments, unused-argument
+@event.listens_for(Engine, "before_cursor_execute")
+def start_timer(conn, cursor, statement, parameters, context, executemany):
+    """Notes when a statement was sent to the database"""
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_timer(conn, cursor, statement, parameters, context, executemany):
+    """Adds the time a statement took to the totals of the current request"""
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if has_request_context():
+        g.sql_count = g.get("sql_count", 0) + 1
+        g.sql_seconds = g.get("sql_seconds", 0.0) + elapsed
+    threshold = SLOW_QUERY["seconds"]
+    if threshold is not None and elapsed >= threshold:
+        slow_query_log.warning(
+            "Slow query %.1fms from %s: %s; parameters=%s",
+            elapsed * 1000,
+            origin(),
+            " ".join(statement.split()),
+            repr(parameters)[:1000] if SLOW_QUERY["parameters"] else "[hidden]",
+        )
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_timer(exception_context):
+    """Forgets the start of a statement that failed"""
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def init_sql_timing(app):
+    """Reports the statements and database time of every request"""
+    SLOW_QUERY["seconds"] = app.config["SLOW_QUERY_SECONDS"]
+    SLOW_QUERY["parameters"] = app.config["SLOW_QUERY_PARAMETERS"]
+
+    @app.before_request
+    def start_request():  # pylint: disable=unused-variable
+        reset()
+
+    @app.after_request
+    def report_request(response):  # pylint: disable=unused-variable
+        count, sql_seconds = request_totals()
+        elapsed = request_elapsed()
+        response.headers["Server-Timing"] = server_timing(count, sql_seconds, elapsed)
+        app.logger.info(
+            "%s %s %s in %.1fms, %d SQL statements in %.1fms",
+            request.method,
+            request.full_path.rstrip("?"),
+            response.status_code,
+            elapsed * 1000,
+            count,
+            sql_seconds * 1000,
+        )
+        return response
@@ -0,0 +1,36 @@
+"""
+Startup Timer
+
+This module times the phases of bringing up a worker so that the time
+it takes to become ready can be tracked per process
+"""
+import os
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Records how long each startup phase of this process takes"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.ready_seconds = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the block it wraps as one startup phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 4)
+
+    def ready(self) -> float:
+        """Marks the process ready and returns the seconds since it started"""
+        self.ready_seconds = round(time.perf_counter() - self.started, 4)
+        return self.ready_seconds
+
+    def summary(self) -> dict:
+        """Returns the process id, the time to ready and each phase"""
+        return {"pid": os.getpid(), "ready_seconds": self.ready_seconds, "phases": dict(self.phases)}
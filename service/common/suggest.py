@@ -0,0 +1,171 @@
+"""
+Suggest Index
+
+This module contains the in-memory index of product names that answers
+typeahead suggestions without a database round trip. The distinct names
+are kept in one sorted list, so the names that start with a prefix are a
+contiguous slice of it, and the best of each slice by likes is cached
+per prefix and kept up to date as names and likes change.
+"""
+import atexit
+import heapq
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger("flask.app")
+
+
+class SuggestIndex:
+    """The product names of this worker with their likes, ranked by prefix"""
+
+    def __init__(self, limit: int = 10, cache_size: int = 4096):
+        self.limit = limit
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        self._top = OrderedDict()
+        self._version = 0
+        self.ready = False
+        self.interval = 0
+        self._load = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def build(self, load):
+        """Replaces the index with the (name, likes, count) rows of load()
+
+        Names that only differ in case are suggested once, with the sum of
+        their likes and counts. A name that changes while load() reads the
+        rows leaves the index not ready, so it is built again before the
+        next suggestion.
+        """
+        with self._build_lock:
+            with self._lock:
+                version = self._version
+            entries = {}
+            for name, likes, count in load():
+                if not name:
+                    continue
+                entry = entries.setdefault(name.lower(), [name, 0, 0])
+                entry[0] = min(entry[0], name)  # the same spelling whatever the order of the rows
+                entry[1] += likes or 0
+                entry[2] += count
+            with self._lock:
+                self._entries = entries
+                self._keys = sorted(entries)
+                self._top.clear()
+                self.ready = self._version == version
+
+    def invalidate(self):
+        """Marks the index as out of date after writes it could not follow"""
+        with self._lock:
+            self._version += 1
+            self.ready = False
+
+    def change(self, name, likes: int = 0, count: int = 0):
+        """Adds likes and Products to a name, which count=-1 takes one away from"""
+        if not name or not (likes or count):
+            return
+        key = name.lower()
+        with self._lock:
+            self._version += 1
+            if not self.ready:
+                return
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [name, 0, 0]
+                insort(self._keys, key)
+            entry[1] += likes
+            entry[2] += count
+            if entry[2] <= 0:
+                del self._entries[key]
+                del self._keys[bisect_left(self._keys, key)]
+            self._rerank(key, dropped=likes < 0 or entry[2] <= 0)
+
+    def rename(self, old_name, old_likes: int, name, likes: int):
+        """Moves a Product from its old name and likes to its new ones"""
+        if old_name and name and old_name.lower() == name.lower():
+            self.change(name, likes=likes - old_likes)
+            return
+        self.change(old_name, likes=-old_likes, count=-1)
+        self.change(name, likes=likes, count=1)
+
+    def _rank(self, key):
+        return (-self._entries[key][1], key)
+
+    def _rerank(self, key, dropped):
+        """Updates the cached best names of every prefix of a changed name"""
+        for end in range(1, len(key) + 1):
+            prefix = key[:end]
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            if key in top:
+                if dropped:
+                    # a name further down may now belong in the top
+                    del self._top[prefix]
+                else:
+                    top.sort(key=self._rank)
+            elif key in self._entries and (len(top) < self.limit or self._rank(key) < self._rank(top[-1])):
+                top.append(key)
+                top.sort(key=self._rank)
+                del top[self.limit:]
+
+    def suggest(self, prefix: str, limit: int = None) -> list:
+        """Returns the (name, likes, count) of the best liked names with a prefix"""
+        key = (prefix or "").lower()
+        if not key:
+            return []
+        with self._lock:
+            top = self._top.get(key)
+            if top is None:
+                start = bisect_left(self._keys, key)
+                end = bisect_left(self._keys, key + "\U0010ffff", start)
+                top = heapq.nsmallest(self.limit, self._keys[start:end], key=self._rank)
+                self._top[key] = top
+                if len(self._top) > self.cache_size:
+                    self._top.popitem(last=False)
+            else:
+                self._top.move_to_end(key)
+            return [tuple(self._entries[name]) for name in top[:limit or self.limit]]
+
+    def start(self, load, interval: float):
+        """Builds the index now and again every interval seconds until shutdown
+
+        The periodic build picks up the writes of the other workers and
+        the likes flushed by the like buffer.
+        """
+        self._load = load
+        self.interval = interval
+        self.refresh()
+        atexit.register(self.stop)
+        if self.interval > 0 and self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="suggest-index", daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        """Builds the index from the rows of the loader given to start()"""
+        try:
+            self.build(self._load)
+        except SQLAlchemyError as error:
+            logger.error("Could not build the suggest index, will retry: %s", error)
+
+    def stop(self):
+        """Stops the periodic build"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.refresh()
@@ -2,6 +2,7 @@
 Global Configuration for Application
 """
 import os
+from service.common.pool import TimedQueuePool
 
 # Get configuration from environment
 DATABASE_URI = os.getenv(
@@ -13,5 +14,95 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool of each worker. By default the gunicorn workers
+# (WEB_CONCURRENCY) split DB_MAX_CONNECTIONS evenly: each one keeps a
+# connection per thread plus one for the like buffer, and may overflow
+# up to its share. Keep DB_MAX_CONNECTIONS below the server's limit.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "1"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "80"))
+DB_POOL_SHARE = max(1, DB_MAX_CONNECTIONS // max(1, WEB_CONCURRENCY))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(min(DB_POOL_SHARE, GUNICORN_THREADS + 1))))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(max(0, DB_POOL_SHARE - DB_POOL_SIZE))))
+# Seconds to wait for a free connection, and to keep one before reopening it
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection as it is checked out so dropped ones are replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "yes", "1")
+
+# SQLite keeps the pool SQLAlchemy picks for it
+SQLALCHEMY_ENGINE_OPTIONS = {}
+if not DATABASE_URI.startswith("sqlite"):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Connection pool of the async engine that service.asgi reads with. It
+# comes on top of the sync pool, which then only serves the endpoints
+# that service.asgi hands to Flask on GUNICORN_THREADS threads
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", str(max(1, DB_POOL_SHARE // 2))))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "0"))
+
+# Optional read replica. GET and HEAD requests read from it, unless the
+# client wrote within REPLICA_STICKY_SECONDS (tracked by a cookie), or
+# the replica failed its last check or is more than
+# REPLICA_MAX_LAG_SECONDS behind. Every worker checks it at most once per
+# REPLICA_CHECK_INTERVAL seconds. Its pool is sized as the primary's
+DATABASE_REPLICA_URI = os.getenv("DATABASE_REPLICA_URI")
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_STICKY_COOKIE = os.getenv("REPLICA_STICKY_COOKIE", "read_primary")
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+
+# Create missing tables when a worker starts, set it to false when the
+# schema is managed with flask db-create / db-migrate instead
+DB_AUTO_CREATE = os.getenv("DB_AUTO_CREATE", "true").lower() in ("true", "yes", "1")
+
+# Keyset pagination of the product list
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# Rows fetched per round trip when streaming the product list as NDJSON
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+# Largest array accepted by the bulk create and bulk inventory adjustment
+# endpoints, which keeps an adjustment under PostgreSQL's 65535 parameters
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+
+# Most matches of a product search that are ranked and paged through
+SEARCH_MAX_MATCHES = int(os.getenv("SEARCH_MAX_MATCHES", "1000"))
+
+# Seconds between rebuilds of the typeahead index from the database, which
+# pick up the writes of other workers, 0 only follows this worker's writes
+SUGGEST_REFRESH_INTERVAL = float(os.getenv("SUGGEST_REFRESH_INTERVAL", "60"))
+# Most suggestions returned for a prefix
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", "10"))
+
+# Read-through cache of Product.find, a size of 0 turns it off
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "5.0"))
+
+# Seconds between write-behind flushes of buffered likes, 0 writes through
+LIKE_FLUSH_INTERVAL = float(os.getenv("LIKE_FLUSH_INTERVAL", "1.0"))
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Content codings to offer, best first, brotli and zstd need their packages
+COMPRESS_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.getenv("COMPRESS_ENCODINGS", "br,zstd,gzip").split(",")
+    if encoding.strip()
+]
+
+# Statements slower than this many seconds go to the slow query log
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.25"))
+# Parameters can hold personal data, set to False to leave them out
+SLOW_QUERY_PARAMETERS = os.getenv("SLOW_QUERY_PARAMETERS", "true").lower() in ("true", "yes", "1")
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
@@ -3,15 +3,30 @@ Models for YourResourceModel
 
 All of the models are stored in this module
 """
-# pylint: disable=too-many-instance-attributes
+# pylint: disable=too-many-instance-attributes, too-many-public-methods, too-many-lines
+import base64
+import binascii
+import json
 import logging
 from datetime import date
+import psycopg
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, bindparam, case, event, func, insert, inspect, literal_column, select, text, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, make_transient_to_detached
+from service.common.cache import LRUCache
+from service.common.replica import RoutingSession, pinned_to_primary
+from service.common.search import SearchIndex, tokenize
+from service.common.suggest import SuggestIndex
 
 logger = logging.getLogger("flask.app")
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+# Create the SQLAlchemy object to be initialized later in init_db(), its
+# sessions read from the replica during GET requests when there is one
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Key of the PostgreSQL advisory lock that serializes schema creation
+SCHEMA_LOCK_KEY = 0x50524F44  # "PROD"
 
 
 # Function to initialize the database
@@ -24,6 +39,30 @@ class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+# Text search configuration and document of product search on PostgreSQL.
+# The 'simple' configuration only lower cases words, like tokenize(), and
+# the GIN index is built on exactly this expression so that it is used
+SEARCH_CONFIG = "simple"
+SEARCH_DOCUMENT = f"to_tsvector('{SEARCH_CONFIG}', coalesce(name, '') || ' ' || category)"
+SEARCH_INDEX = "ix_product_search"
+
+# Columns that the product list can be sorted and paged by. Every one of
+# them is NOT NULL so that the (key, id) keyset comparison is well defined.
+SORT_KEYS = ("id", "price", "category", "inventory", "like", "created_date")
+
+# Largest value of the INTEGER inventory column, which is 32 bits on PostgreSQL
+INVENTORY_MAX = 2**31 - 1
+
+
+def is_of_type(value, python_type) -> bool:
+    """Checks a value decoded from JSON against the Python type of a column"""
+    if isinstance(value, bool):
+        return python_type is bool
+    if python_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, python_type)
+
+
 class Product(db.Model):
     """
     Class that represents a Product
@@ -31,6 +70,34 @@ class Product(db.Model):
 
     app = None
 
+    # Read-through cache of column values for find(), sized in init_db()
+    cache = LRUCache(maxsize=0)
+
+    # In-process index of search() where the database has no full-text
+    # index, built on the first search and kept up to date by every write
+    search_index = SearchIndex()
+    # Most matches that a search ranks and pages through, set in init_db()
+    search_max_matches = 1000
+
+    # Names ranked by likes for typeahead, built in init_db() and kept up
+    # to date by every write of this worker
+    suggestions = SuggestIndex()
+
+    # Secondary indexes for the list filters and sort keys.
+    # Apply them to an existing database with: flask db-migrate
+    __table_args__ = (
+        db.Index("ix_product_name", "name"),
+        db.Index("ix_product_category_available", "category", "available"),
+        db.Index("ix_product_available_id", "available", "id"),
+        db.Index(
+            "ix_product_enabled_price",
+            "price",
+            "id",
+            postgresql_where=db.text("disable = false"),
+            sqlite_where=db.text("disable = 0"),
+        ),
+    )
+
     # Table Schema
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(63))
@@ -54,6 +121,115 @@ class Product(db.Model):
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
         db.session.commit()
+        Product.cache.invalidate(self.id)
+        Product.search_index.add(self.id, self.name, self.category)
+        Product.suggestions.change(self.name, likes=self.like or 0, count=1)
+
+    def column_values(self) -> list:
+        """Returns the values of every column but id, with defaults filled in"""
+        values = []
+        for column in self.__table__.columns:
+            if column.primary_key:
+                continue
+            value = getattr(self, column.key)
+            if value is None and column.default is not None:
+                value = column.default.arg
+            values.append(value)
+        return values
+
+    @classmethod
+    def bulk_insert(cls, products: list):
+        """
+        Creates many Products with a Core multi-row INSERT
+
+        Skipping the unit of work makes this several times faster than
+        bulk_create, but the new ids are not returned.
+
+        :param products: the deserialized Products to create
+        :type products: list
+
+        """
+        logger.info("Inserting %s Products", len(products))
+        table = cls.__table__
+        keys = [column.key for column in table.columns if not column.primary_key]
+        try:
+            db.session.execute(
+                insert(table),
+                [dict(zip(keys, product.column_values())) for product in products],
+            )
+        except DBAPIError as error:
+            db.session.rollback()
+            raise DataValidationError(
+                "Invalid Product: rejected by the database - " + str(error.orig)
+            ) from error
+        db.session.commit()
+        cls.search_index.invalidate()  # the new ids are not known
+        cls.suggestions.invalidate()
+
+    @classmethod
+    def bulk_copy(cls, products: list):
+        """
+        Creates many Products with the PostgreSQL COPY protocol
+
+        This is the fastest way to load rows, but it only works with the
+        psycopg driver and does not return the new ids.
+
+        :param products: the deserialized Products to create
+        :type products: list
+
+        """
+        logger.info("Copying %s Products", len(products))
+        connection = db.session.connection()
+        if connection.dialect.name != "postgresql" or connection.dialect.driver != "psycopg":
+            raise DataValidationError("COPY requires PostgreSQL with the psycopg driver")
+        quote = connection.dialect.identifier_preparer.quote
+        table = cls.__table__
+        columns = ", ".join(quote(c.name) for c in table.columns if not c.primary_key)
+        cursor = connection.connection.driver_connection.cursor()
+        try:
+            with cursor.copy(f"COPY {quote(table.name)} ({columns}) FROM STDIN") as copy:
+                for product in products:
+                    copy.write_row(product.column_values())
+        except psycopg.Error as error:
+            db.session.rollback()
+            raise DataValidationError("Invalid Product: rejected by the database - " + str(error)) from error
+        db.session.commit()
+        cls.search_index.invalidate()  # the new ids are not known
+        cls.suggestions.invalidate()
+
+    @classmethod
+    def bulk_create(cls, products: list) -> list:
+        """
+        Creates many Products with one multi-row INSERT in one transaction
+
+        :param products: the deserialized Products to create
+        :type products: list
+
+        :return: the ids assigned to the Products, in the same order
+        :rtype: list
+
+        """
+        logger.info("Creating %s Products", len(products))
+        for product in products:
+            product.id = None
+        db.session.add_all(products)
+        try:
+            db.session.flush()  # one INSERT ... VALUES (...), (...) RETURNING id
+        except DBAPIError as error:
+            db.session.rollback()
+            raise DataValidationError(
+                "Invalid Product: rejected by the database - " + str(error.orig)
+            ) from error
+        ids = [product.id for product in products]
+        documents = [(product.id, product.name, product.category) for product in products]
+        names = [(product.name, product.like or 0) for product in products]
+        db.session.commit()
+        cls.cache.invalidate(*ids)
+        for document in documents:
+            cls.search_index.add(*document)
+        for name, likes in names:
+            cls.suggestions.change(name, likes=likes, count=1)
+        return ids
 
     def update(self):
         """
@@ -62,27 +238,45 @@ class Product(db.Model):
         logger.info("Saving %s", self.name)
         if not self.id:
             raise DataValidationError("Empty ID field!")
+        old_name, old_like = self.loaded_value("name"), self.loaded_value("like") or 0
         db.session.commit()
+        Product.cache.invalidate(self.id)
+        Product.search_index.add(self.id, self.name, self.category)
+        Product.suggestions.rename(old_name, old_like, self.name, self.like or 0)
 
     def delete(self):
         """Removes a YourResourceModel from the data store"""
         logger.info("Deleting %s", self.name)
+        name, like = self.name, self.like or 0
         db.session.delete(self)
         db.session.commit()
+        Product.cache.invalidate(self.id)
+        Product.search_index.remove(self.id)
+        Product.suggestions.change(name, likes=-like, count=-1)
+
+    def loaded_value(self, key):
+        """Returns the value of a column as it was loaded, before any change"""
+        history = inspect(self).attrs[key].history
+        return history.deleted[0] if history.deleted else getattr(self, key)
 
     def serialize(self):
         """Serializes a Product into a dictionary"""
+        return Product.serialize_row(self)
+
+    @staticmethod
+    def serialize_row(row):
+        """Serializes a Product, or a database row of one, into a dictionary"""
         return {
-            "id": self.id,
-            "name": self.name,
-            "price": self.price,
-            "category": self.category,
-            "inventory": self.inventory,
-            "available": self.available,
-            "created_date": self.created_date.isoformat(),
-            "modified_date": self.modified_date.isoformat(),
-            "like": self.like if self.modified_date is not None else None,
-            "disable": self.disable or False,
+            "id": row.id,
+            "name": row.name,
+            "price": row.price,
+            "category": row.category,
+            "inventory": row.inventory,
+            "available": row.available,
+            "created_date": row.created_date.isoformat(),
+            "modified_date": row.modified_date.isoformat(),
+            "like": row.like if row.modified_date is not None else None,
+            "disable": row.disable or False,
         }
 
     def deserialize(self, data):
@@ -120,6 +314,8 @@ class Product(db.Model):
                 "Invalid Product: body of request contained bad or no data - "
                 "Error message: " + str(error)
             ) from error
+        except ValueError as error:
+            raise DataValidationError("Invalid Product: bad date - " + str(error)) from error
         return self
 
     @classmethod
@@ -129,9 +325,141 @@ class Product(db.Model):
         cls.app = app
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
+        cls.cache = LRUCache(app.config["PRODUCT_CACHE_SIZE"], app.config["PRODUCT_CACHE_TTL"])
+        cls.search_max_matches = app.config["SEARCH_MAX_MATCHES"]
+        cls.suggestions.limit = app.config["SUGGEST_LIMIT"]
         app.app_context().push()
-        db.drop_all()
-        db.create_all()  # make our sqlalchemy tables
+        if app.config["DB_AUTO_CREATE"]:
+            cls.create_schema()
+        cls.suggestions.start(cls.suggestion_rows, app.config["SUGGEST_REFRESH_INTERVAL"])
+
+    @classmethod
+    def create_schema(cls):
+        """Creates the tables that do not exist yet, keeping all data
+
+        Once the table exists this is a single catalog lookup. Otherwise
+        the workers that start together take turns on an advisory lock
+        (on PostgreSQL) so that only the first one runs the DDL.
+
+        :return: True if this call created the schema
+        :rtype: bool
+
+        """
+        if inspect(db.engine).has_table(cls.__tablename__):
+            return False
+        with db.engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+            if inspect(conn).has_table(cls.__tablename__):
+                return False
+            logger.info("Creating the database schema")
+            db.metadata.create_all(conn)  # make our sqlalchemy tables
+        return True
+
+    @classmethod
+    def purchase(cls, by_id, quantity: int = 1):
+        """Atomically takes some inventory of an available Product
+
+        The check and the decrement happen in one conditional UPDATE, so
+        concurrent purchases can neither lose updates nor oversell.
+
+        :param by_id: the id of the Product to purchase
+        :param quantity: how many units to take out of inventory
+        :type quantity: int
+
+        :return: the purchased Product, detached from the session, or None
+            if it does not exist, is not available or is short of inventory
+        :rtype: Product
+
+        """
+        logger.info("Processing purchase of %s x id %s ...", quantity, by_id)
+        table = cls.__table__
+        remaining = table.c.inventory - quantity
+        statement = (
+            update(table)
+            .where(
+                table.c.id == by_id,
+                table.c.available.is_(True),
+                table.c.inventory >= quantity,
+            )
+            .values(inventory=remaining, available=remaining > 0)
+            .returning(*table.columns)
+        )
+        row = db.session.execute(statement).first()
+        db.session.commit()
+        if not row:
+            return None
+        cls.cache.invalidate(row.id)
+        return cls(**row._mapping)
+
+    @classmethod
+    def adjust_inventory(cls, changes: dict):
+        """Adjusts the inventory of many Products in one set-based UPDATE
+
+        Inventory that would drop to zero or below is clamped to zero and
+        the Product is marked unavailable, as for a single adjustment.
+        Nothing is changed unless every Product exists and every new
+        inventory fits in the column.
+
+        :param changes: the inventory change, keyed by Product id
+        :type changes: dict
+
+        :return: the adjusted Products, detached from the session, and the
+            ids that were not found
+        :rtype: tuple
+
+        """
+        logger.info("Adjusting inventory of %s Products", len(changes))
+        table = cls.__table__
+        inventory = table.c.inventory + case(changes, value=table.c.id)
+        statement = (
+            update(table)
+            .where(table.c.id.in_(list(changes)))
+            .values(
+                inventory=case((inventory <= 0, 0), else_=inventory),
+                available=case((inventory <= 0, False), else_=table.c.available),
+            )
+            .returning(*table.columns)
+        )
+        try:
+            rows = db.session.execute(statement).all()
+        except DBAPIError as error:
+            db.session.rollback()
+            raise DataValidationError(
+                "Invalid inventory change: rejected by the database - " + str(error.orig)
+            ) from error
+        if any(row.inventory > INVENTORY_MAX for row in rows):  # SQLite integers are 64 bits
+            db.session.rollback()
+            raise DataValidationError(f"Invalid inventory change: inventory cannot be more than {INVENTORY_MAX}")
+        missing = set(changes).difference(row.id for row in rows)
+        if missing:
+            db.session.rollback()
+            return [], sorted(missing)
+        db.session.commit()
+        cls.cache.invalidate(*changes)
+        return [cls(**row._mapping) for row in rows], []
+
+    @classmethod
+    def add_likes(cls, deltas: dict):
+        """Adds like counts to many Products in one batched UPDATE
+
+        :param deltas: the number of likes to add, keyed by Product id
+        :type deltas: dict
+
+        """
+        logger.info("Adding likes to %s Products", len(deltas))
+        table = cls.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("product_id"))
+            .values(like=table.c.like + bindparam("delta"))
+        )
+        db.session.execute(
+            statement,
+            [{"product_id": key, "delta": value} for key, value in deltas.items()],
+        )
+        db.session.commit()
+        cls.cache.invalidate(*deltas)
 
     @classmethod
     def all(cls):
@@ -140,10 +468,40 @@ class Product(db.Model):
         return cls.query.all()
 
     @classmethod
-    def find(cls, by_id):
-        """Finds a YourResourceModel by it's ID"""
+    def cached(cls, key: int):
+        """Returns the cached column values of a Product, or None
+
+        A client that is reading its own writes from the primary skips the
+        cache, which a lagging replica may have filled with older values.
+        """
+        if pinned_to_primary():
+            return None
+        return cls.cache.get(key)
+
+    @classmethod
+    def find(cls, by_id, cached: bool = True):
+        """Finds a YourResourceModel by it's ID
+
+        Hot Products are served from the read-through cache, which
+        create(), update() and delete() keep up to date. Other workers'
+        writes show up once the cached entry's TTL runs out, so a lookup
+        that is modified and written back must pass cached=False.
+        """
         logger.info("Processing lookup for id %s ...", by_id)
-        return cls.query.get(by_id)
+        try:
+            key = int(by_id)
+        except (TypeError, ValueError):
+            return cls.query.get(by_id)
+        values = cls.cached(key) if cached else None
+        if values is not None:
+            product = cls(**values)
+            make_transient_to_detached(product)
+            return db.session.merge(product, load=False)
+        # an uncached lookup also replaces a cached copy already in the session
+        product = (cls.query if cached else cls.query.populate_existing()).get(key)
+        if product:
+            cls.cache.put(key, {c.key: getattr(product, c.key) for c in cls.__table__.columns})
+        return product
 
     @classmethod
     def find_by_name(cls, name):
@@ -182,3 +540,472 @@ class Product(db.Model):
         """
         logger.info("Query that finds Products by their availability")
         return cls.query.filter(cls.available == available)
+
+    @classmethod
+    def criteria(  # pylint: disable=too-many-arguments
+        cls,
+        name=None,
+        category=None,
+        available=None,
+        disable=None,
+        min_price=None,
+        max_price=None,
+        min_inventory=None,
+        max_inventory=None,
+    ) -> list:
+        """Returns the SQL conditions for every filter that was supplied
+
+        Filters left as None are skipped, so callers can pass their query
+        arguments straight through and AND together whatever is present.
+
+        :return: a list of SQL expressions to AND together
+        :rtype: list
+
+        """
+        conditions = []
+        if name is not None:
+            conditions.append(cls.name == name)
+        if category is not None:
+            conditions.append(cls.category == category)
+        if available is not None:
+            conditions.append(cls.available == available)
+        if disable is not None:
+            conditions.append(cls.disable == disable)
+        if min_price is not None:
+            conditions.append(cls.price >= min_price)
+        if max_price is not None:
+            conditions.append(cls.price <= max_price)
+        if min_inventory is not None:
+            conditions.append(cls.inventory >= min_inventory)
+        if max_inventory is not None:
+            conditions.append(cls.inventory <= max_inventory)
+        return conditions
+
+    @classmethod
+    def find_by_filters(cls, **filters):
+        """Returns all Products that match every one of the given filters
+
+        :param filters: any of the keyword arguments accepted by criteria()
+        :type filters: dict
+
+        :return: a query of the matching Products
+        :rtype: Query
+
+        """
+        logger.info("Processing filtered query for %s ...", filters)
+        return cls.query.filter(*cls.criteria(**filters))
+
+    @classmethod
+    def paginate(cls, query, sort="id", limit=None, cursor=None):
+        """Returns one page of a query using keyset (cursor) pagination
+
+        The rows are ordered by (sort key, id) and the page starts right
+        after the row encoded in the cursor, so the database can walk an
+        index instead of counting past an OFFSET.
+
+        :param query: the query of Products to page through
+        :type query: Query
+        :param sort: the column to sort by, prefixed with "-" for descending
+        :type sort: str
+        :param limit: the maximum number of Products to return, or None for all
+        :type limit: int
+        :param cursor: the cursor returned with the previous page
+        :type cursor: str
+
+        :return: the Products in the page and the cursor of the next page,
+            which is None when this is the last page
+        :rtype: tuple
+
+        """
+        query = cls.keyset(query, sort, cursor)
+        if limit is None:
+            return query.all(), None
+
+        logger.info("Processing page of %s Products sorted by %s", limit, sort)
+        products = query.limit(limit + 1).all()
+        if len(products) <= limit:
+            return products, None
+        products = products[:limit]
+        return products, cls.encode_cursor(products[-1], sort)
+
+    @classmethod
+    def keyset(cls, query, sort="id", cursor=None):
+        """Orders a query by (sort key, id) and starts it after a cursor
+
+        :param query: the query of Products to order
+        :type query: Query
+        :param sort: the column to sort by, prefixed with "-" for descending
+        :type sort: str
+        :param cursor: the cursor of the last row already seen, if any
+        :type cursor: str
+
+        :return: the ordered query
+        :rtype: Query
+
+        """
+        descending = sort.startswith("-")
+        key = sort.lstrip("-")
+        if key not in SORT_KEYS:
+            raise DataValidationError(f"Invalid sort key: {key}")
+        column = getattr(cls, key)
+        keyset = (column, cls.id) if key != "id" else (cls.id,)
+
+        if cursor:
+            values = cls.decode_cursor(cursor, sort)
+            if descending:
+                query = query.filter(tuple_(*keyset) < tuple_(*values))
+            else:
+                query = query.filter(tuple_(*keyset) > tuple_(*values))
+        if descending:
+            return query.order_by(*[col.desc() for col in keyset])
+        return query.order_by(*keyset)
+
+    @classmethod
+    def stream(cls, query, batch_size=1000):
+        """Iterates over a query without loading all of its rows at once
+
+        The rows are read from a server-side cursor in batches, so memory
+        stays flat no matter how many Products the query matches.
+
+        :param query: the query of Products to read
+        :type query: Query
+        :param batch_size: the number of rows to fetch per round trip
+        :type batch_size: int
+
+        :return: an iterator of Products
+        :rtype: Iterator
+
+        """
+        logger.info("Streaming Products in batches of %s", batch_size)
+        return query.yield_per(batch_size)
+
+    @classmethod
+    def project(cls, query, columns):
+        """Narrows a query of Products down to some of their columns
+
+        Only those columns are selected and they come back as plain rows,
+        so no Product objects are built for them.
+
+        :param query: the query of Products to narrow
+        :type query: Query
+        :param columns: the names of the columns to select
+        :type columns: list
+
+        :return: a query of rows with the columns as attributes
+        :rtype: Query
+
+        """
+        logger.info("Projecting Products onto %s", columns)
+        return query.with_entities(*(getattr(cls, column) for column in columns))
+
+    @classmethod
+    def find_columns(cls, by_id, columns):
+        """Finds some of the columns of a Product by its ID
+
+        A Product held by the cache is served from it, other Products only
+        have the given columns read.
+
+        :param by_id: the id of the Product to find
+        :type by_id: int
+        :param columns: the names of the columns to read
+        :type columns: list
+
+        :return: the Product, a row of its columns, or None if not found
+        :rtype: Product
+
+        """
+        logger.info("Processing lookup of %s for id %s ...", columns, by_id)
+        try:
+            key = int(by_id)
+        except (TypeError, ValueError):
+            return None
+        values = cls.cached(key)
+        if values is not None:
+            return cls(**values)
+        return cls.project(cls.query.filter(cls.id == key), columns).first()
+
+    ##################################################
+    # ASYNC METHODS, for an AsyncSession in service.asgi
+    ##################################################
+
+    @classmethod
+    async def find_async(cls, session, by_id: int):
+        """Finds a Product by its ID on an AsyncSession
+
+        Shares the read-through cache with find(). A cached Product is
+        returned transient, since async callers only read it.
+
+        :param session: the AsyncSession to read with
+        :type session: AsyncSession
+        :param by_id: the id of the Product to find
+        :type by_id: int
+
+        :return: the Product, or None if not found
+        :rtype: Product
+
+        """
+        logger.info("Processing async lookup for id %s ...", by_id)
+        values = cls.cached(by_id)
+        if values is not None:
+            return cls(**values)
+        product = await session.get(cls, by_id)
+        if product:
+            cls.cache.put(by_id, {c.key: getattr(product, c.key) for c in cls.__table__.columns})
+        return product
+
+    @classmethod
+    async def find_columns_async(cls, session, by_id: int, columns):
+        """Finds some of the columns of a Product by its ID on an AsyncSession
+
+        :param session: the AsyncSession to read with
+        :type session: AsyncSession
+        :param by_id: the id of the Product to find
+        :type by_id: int
+        :param columns: the names of the columns to read
+        :type columns: list
+
+        :return: the cached Product, a row of its columns, or None if not found
+        :rtype: Product
+
+        """
+        logger.info("Processing async lookup of %s for id %s ...", columns, by_id)
+        values = cls.cached(by_id)
+        if values is not None:
+            return cls(**values)
+        result = await session.execute(cls.select_by_filters(columns).where(cls.id == by_id))
+        return result.first()
+
+    @classmethod
+    def select_by_filters(cls, columns=None, **filters):
+        """Returns a SELECT of the Products that match every filter
+
+        The 2.0 style counterpart of find_by_filters() and project(),
+        which keyset() can order like a query.
+
+        :param columns: the names of the columns to select, or None for Products
+        :type columns: list
+        :param filters: any of the keyword arguments accepted by criteria()
+        :type filters: dict
+
+        :return: the SELECT statement
+        :rtype: Select
+
+        """
+        if columns:
+            statement = select(*(getattr(cls, column) for column in columns))
+        else:
+            statement = select(cls)
+        return statement.where(*cls.criteria(**filters))
+
+    @classmethod
+    async def paginate_async(  # pylint: disable=too-many-arguments
+        cls, session, statement, sort="id", limit=None, cursor=None
+    ):
+        """Returns one page of a SELECT on an AsyncSession, like paginate()
+
+        :param session: the AsyncSession to read with
+        :type session: AsyncSession
+        :param statement: a SELECT made by select_by_filters()
+        :type statement: Select
+
+        :return: the Products or rows in the page and the cursor of the
+            next page, which is None when this is the last page
+        :rtype: tuple
+
+        """
+        statement = cls.keyset(statement, sort, cursor)
+        if limit is not None:
+            logger.info("Processing async page of %s Products sorted by %s", limit, sort)
+            statement = statement.limit(limit + 1)
+        result = await session.execute(statement)
+        if statement.column_descriptions[0]["expr"] is cls:
+            products = result.scalars().all()
+        else:
+            products = result.all()
+        if limit is None or len(products) <= limit:
+            return products, None
+        products = products[:limit]
+        return products, cls.encode_cursor(products[-1], sort)
+
+    @classmethod
+    def search(cls, terms: str, limit: int, cursor=None):
+        """Returns one page of the Products whose name and category match words
+
+        Every word of the terms must start a word of the name or category,
+        so "coc bev" finds a Coke in beverage. The best matches come first.
+        PostgreSQL ranks them with ts_rank over the GIN index, other
+        databases with the in-process search_index, ties going to the
+        lowest id. Only the best search_max_matches matches are paged
+        through, which bounds the offset of the last page.
+
+        :param terms: the words to search for
+        :type terms: str
+        :param limit: the maximum number of Products to return
+        :type limit: int
+        :param cursor: the cursor returned with the previous page
+        :type cursor: str
+
+        :return: the Products in the page and the cursor of the next page,
+            which is None when this is the last page
+        :rtype: tuple
+
+        """
+        words = tokenize(terms)
+        if not words:
+            raise DataValidationError("Search terms must contain at least one word")
+        offset = cls.decode_search_cursor(cursor, words) if cursor else 0
+        logger.info("Processing search for %s from %s ...", words, offset)
+        fetch = min(limit + 1, cls.search_max_matches - offset)
+        if fetch <= 0:
+            return [], None
+        if db.engine.dialect.name == "postgresql":
+            products = cls.search_database(words, offset, fetch)
+        else:
+            products = cls.search_in_process(words, offset, fetch)
+        if len(products) <= limit:
+            return products, None
+        return products[:limit], cls.encode_search_cursor(words, offset + limit)
+
+    @classmethod
+    def search_database(cls, words: list, offset: int, limit: int) -> list:
+        """Ranks the matches of words with the full-text index of PostgreSQL"""
+        document = literal_column(SEARCH_DOCUMENT)
+        query = func.to_tsquery(
+            literal_column(f"'{SEARCH_CONFIG}'::regconfig"),
+            " & ".join(f"{word}:*" for word in words),
+        )
+        return (
+            cls.query.filter(document.op("@@")(query))
+            .order_by(func.ts_rank(document, query).desc(), cls.id)
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
+
+    @classmethod
+    def search_in_process(cls, words: list, offset: int, limit: int) -> list:
+        """Ranks the matches of words with the in-process search_index"""
+        if not cls.search_index.ready:
+            logger.info("Building the search index")
+            cls.search_index.build(lambda: db.session.execute(select(cls.id, cls.name, cls.category)))
+        ids = cls.search_index.search(words, offset + limit)[offset:]
+        if not ids:
+            return []
+        found = {product.id: product for product in cls.query.filter(cls.id.in_(ids))}
+        return [found[product_id] for product_id in ids if product_id in found]
+
+    @classmethod
+    def suggest(cls, prefix: str, limit: int = None) -> list:
+        """Returns the best liked names that start with a prefix, for typeahead
+
+        The names come from the in-memory suggestions index, so no query is
+        sent unless bulk writes made it rebuild.
+
+        :param prefix: the start of the name, in any case
+        :type prefix: str
+        :param limit: the maximum number of names to return
+        :type limit: int
+
+        :return: the (name, likes, count) of the names, most liked first
+        :rtype: list
+
+        """
+        if not cls.suggestions.ready:
+            logger.info("Building the suggest index")
+            cls.suggestions.refresh()
+        return cls.suggestions.suggest(prefix, limit)
+
+    @classmethod
+    def suggestion_rows(cls) -> list:
+        """Returns the (name, likes, count) of every name, for the suggestions index"""
+        with cls.app.app_context():
+            # pylint: disable=not-callable
+            statement = select(cls.name, func.sum(cls.like), func.count(cls.id)).group_by(cls.name)
+            return db.session.execute(statement).all()
+
+    @classmethod
+    def encode_search_cursor(cls, words: list, offset: int) -> str:
+        """Encodes how far into the results of a search the next page starts
+
+        Ranks are not unique or stable enough to seek to, so search pages
+        by offset, which only the last pages of a broad search pay for.
+        """
+        payload = json.dumps([words, offset], separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def decode_search_cursor(cls, cursor: str, words: list) -> int:
+        """Decodes a cursor made by encode_search_cursor for the same words"""
+        try:
+            cursor_words, offset = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except (ValueError, TypeError, binascii.Error) as error:
+            raise DataValidationError(f"Invalid cursor: {cursor}") from error
+        if cursor_words != words or not isinstance(offset, int) or offset < 0:
+            raise DataValidationError(f"Cursor was not made for a search of {words}")
+        return offset
+
+    @classmethod
+    def encode_cursor(cls, product, sort="id") -> str:
+        """Encodes the keyset position of a Product into an opaque cursor"""
+        key = sort.lstrip("-")
+        value = getattr(product, key)
+        if isinstance(value, date):
+            value = value.isoformat()
+        payload = json.dumps([sort, value, product.id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def decode_cursor(cls, cursor: str, sort="id") -> tuple:
+        """Decodes a cursor back into the keyset values it was made from
+
+        :param cursor: a cursor made by encode_cursor
+        :type cursor: str
+        :param sort: the sort the cursor must have been made for
+        :type sort: str
+
+        :return: the (sort key value, id) of the last row of the previous page
+        :rtype: tuple
+
+        """
+        key = sort.lstrip("-")
+        python_type = getattr(cls, key).type.python_type
+        try:
+            payload = base64.urlsafe_b64decode(cursor.encode("ascii"))
+            cursor_sort, value, last_id = json.loads(payload)
+            if cursor_sort == sort and python_type is date:
+                value = date.fromisoformat(value)
+        except (ValueError, TypeError, binascii.Error) as error:
+            raise DataValidationError(f"Invalid cursor: {cursor}") from error
+        if cursor_sort != sort:
+            raise DataValidationError(
+                f"Cursor was made for sort [{cursor_sort}], not [{sort}]"
+            )
+        # a forged cursor must not reach the database with values of another type
+        if not is_of_type(last_id, int) or not is_of_type(value, python_type):
+            raise DataValidationError(f"Invalid cursor: {cursor}")
+        if key == "id":
+            return (last_id,)
+        return (value, last_id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def invalidate_product_cache(orm_execute_state):
+    """Empties the Product cache when a bulk UPDATE or DELETE may change any row"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ is Product:
+        Product.cache.clear()
+        # the statement may have changed the name, category or likes
+        Product.search_index.invalidate()
+        Product.suggestions.invalidate()
+
+
+# The full-text index of search() on PostgreSQL, which other databases
+# cannot build. Apply it to an existing database with: flask db-migrate
+SEARCH_INDEX_DDL = f"CREATE INDEX {SEARCH_INDEX} ON product USING gin ({SEARCH_DOCUMENT})"
+event.listen(
+    Product.__table__,
+    "after_create",
+    DDL(SEARCH_INDEX_DDL).execute_if(dialect="postgresql"),
+)
@@ -4,14 +4,52 @@ Product Service
 Paths:
 PUT /products/{product_id} - Updates a Product record in the database
 """
+# pylint: disable=too-many-lines
 
-from flask import request, abort
+import hashlib
+from datetime import datetime, time, timezone
+from operator import attrgetter
+from urllib.parse import urlencode
+from flask import request, abort, stream_with_context, url_for
 from flask_restx import Resource, fields, reqparse, inputs
-from service.common import status  # HTTP Status Codes
-from service.models import Product
+from werkzeug.http import http_date, is_resource_modified, quote_etag, unquote_etag
+from service.common import replica, status  # HTTP Status Codes
+from service.common.like_buffer import likes
+from service.common.metrics import exposition
+from service.common.pool import pool_stats
+from service.common.serializer import dumps
+from service.models import db, Product, DataValidationError, INVENTORY_MAX, SORT_KEYS
 
 # Import Flask application
-from . import app, api
+from . import app, api, startup
+
+NDJSON = "application/x-ndjson"
+
+# the keys of a serialized Product, which are also its column names
+PRODUCT_FIELDS = (
+    "id",
+    "name",
+    "price",
+    "category",
+    "inventory",
+    "available",
+    "created_date",
+    "modified_date",
+    "like",
+    "disable",
+)
+
+# query string arguments that are pushed down into the SQL WHERE clause
+PRODUCT_FILTERS = (
+    "name",
+    "category",
+    "available",
+    "disable",
+    "min_price",
+    "max_price",
+    "min_inventory",
+    "max_inventory",
+)
 
 
 ############################################################
@@ -20,7 +58,23 @@ from . import app, api
 @app.route("/health")
 def health():
     """Health Status"""
-    return {"status": "OK"}, status.HTTP_200_OK
+    return {
+        "status": "OK",
+        "cache": Product.cache.stats(),
+        "pool": pool_stats(db.engine),
+        "replica": replica.router.stats(),
+        "startup": startup.summary(),
+    }, status.HTTP_200_OK
+
+
+############################################################
+# Metrics Endpoint
+############################################################
+@app.route("/metrics")
+def metrics():
+    """Prometheus Metrics of every worker"""
+    body, content_type = exposition()
+    return app.response_class(body, content_type=content_type)
 
 
 ######################################################################
@@ -100,6 +154,177 @@ product_args.add_argument(
     required=False,
     help="List Products by availability",
 )
+product_args.add_argument(
+    "disable",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    help="List Products that are or are not disabled",
+)
+product_args.add_argument(
+    "min_price",
+    type=float,
+    location="args",
+    required=False,
+    help="List Products that cost at least this much",
+)
+product_args.add_argument(
+    "max_price",
+    type=float,
+    location="args",
+    required=False,
+    help="List Products that cost at most this much",
+)
+product_args.add_argument(
+    "min_inventory",
+    type=int,
+    location="args",
+    required=False,
+    help="List Products with at least this much inventory",
+)
+product_args.add_argument(
+    "max_inventory",
+    type=int,
+    location="args",
+    required=False,
+    help="List Products with at most this much inventory",
+)
+product_args.add_argument(
+    "sort",
+    type=str,
+    location="args",
+    required=False,
+    default="id",
+    choices=SORT_KEYS + tuple(f"-{key}" for key in SORT_KEYS),
+    help="Sort Products by this column, prefixed with - for descending",
+)
+product_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["PAGE_SIZE_MAX"]),
+    location="args",
+    required=False,
+    help="Return at most this many Products per page",
+)
+product_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="Return the page after this cursor from the Link header",
+)
+product_args.add_argument(
+    "stream",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    default=False,
+    help="Stream the Products as newline delimited JSON",
+)
+product_args.add_argument(
+    "fields",
+    type=str,
+    location="args",
+    required=False,
+    help="Return only these comma separated fields of each Product",
+)
+
+# query string arguments of a single Product
+field_args = reqparse.RequestParser()
+field_args.add_argument(
+    "fields",
+    type=str,
+    location="args",
+    required=False,
+    help="Return only these comma separated fields of the Product",
+)
+
+# query string arguments of a search
+search_args = reqparse.RequestParser()
+search_args.add_argument(
+    "q",
+    type=str,
+    location="args",
+    required=True,
+    help="Search for Products whose name and category start with these words",
+)
+search_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["PAGE_SIZE_MAX"]),
+    location="args",
+    required=False,
+    help="Return at most this many Products per page",
+)
+search_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="Return the page after this cursor from the Link header",
+)
+
+# query string arguments of typeahead suggestions
+suggest_args = reqparse.RequestParser()
+suggest_args.add_argument(
+    "prefix",
+    type=str,
+    location="args",
+    required=True,
+    help="Suggest the names of Products that start with this",
+)
+suggest_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["SUGGEST_LIMIT"]),
+    location="args",
+    required=False,
+    help="Return at most this many names",
+)
+
+suggestion_model = api.model(
+    "Suggestion",
+    {
+        "name": fields.String(description="The name of the Products"),
+        "like": fields.Integer(description="The likes of all the Products with this name"),
+        "count": fields.Integer(description="The number of Products with this name"),
+    },
+)
+
+batch_result_model = api.model(
+    "BatchResult",
+    {
+        "index": fields.Integer(description="The position of the item in the batch"),
+        "status": fields.Integer(description="The HTTP status of the item"),
+        "id": fields.String(description="The id of the created Product"),
+        "error": fields.String(description="Why the item was not created"),
+    },
+)
+
+batch_args = reqparse.RequestParser()
+batch_args.add_argument(
+    "atomic",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    default=True,
+    help="Create all of the Products or none of them",
+)
+
+adjust_item_model = api.model(
+    "AdjustInventoryItem",
+    {
+        "id": fields.Integer(required=True, description="The Product identifier"),
+        "inventory_change": fields.Integer(required=True, description="Inventory Change"),
+    },
+)
+
+purchase_args = reqparse.RequestParser()
+purchase_args.add_argument(
+    "quantity",
+    type=inputs.positive,
+    location="args",
+    required=False,
+    default=1,
+    help="How many units of the Product to purchase",
+)
 
 
 ######################################################################
@@ -121,22 +346,25 @@ class ProductResource(Resource):
     # RETRIEVE A product
     # ------------------------------------------------------------------
     @api.doc("get_products")
+    @api.expect(field_args, validate=True)
+    @api.response(200, "Success", product_model)
+    @api.response(304, "Product not modified")
     @api.response(404, "Product not found")
-    @api.marshal_with(product_model)
     def get(self, product_id):
         """
         Retrieve a single product
 
-        This endpoint will return a product based on it's id
+        This endpoint will return a product based on it's id.
+        Send the ETag back in If-None-Match to get a 304 while it is unchanged.
         """
         app.logger.info("Request to Retrieve a product with id [%s]", product_id)
-        product = Product.find(product_id)
-        if not product:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"product with id '{product_id}' was not found.",
-            )
-        return product.serialize(), status.HTTP_200_OK
+        field_names = parse_fields(field_args.parse_args()["fields"])
+        columns = projected_columns(field_names)
+        if field_names:
+            product = Product.find_columns(product_id, columns)
+        else:
+            product = Product.find(product_id)
+        return product_response(product_id, product, field_names, columns)
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING product
@@ -145,7 +373,7 @@ class ProductResource(Resource):
     @api.response(404, "product not found")
     @api.response(400, "The posted product data was not valid")
     @api.expect(product_model)
-    @api.marshal_with(product_model)
+    @api.response(200, "Success", product_model)
     # @token_required
     def put(self, product_id):
         """
@@ -154,7 +382,7 @@ class ProductResource(Resource):
         This endpoint will update a product
         """
         app.logger.info("Request to Update a product with id [%s]", product_id)
-        product = Product.find(product_id)
+        product = Product.find(product_id, cached=False)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
@@ -162,10 +390,12 @@ class ProductResource(Resource):
             )
         app.logger.debug("Payload = %s", api.payload)
         data = api.payload
+        # the like sent back already counts the buffered likes shown by GET
+        likes.discard(product.id)
         product.deserialize(data)
         product.id = product_id
         product.update()
-        return product.serialize(), status.HTTP_200_OK
+        return json_response(product_dict(product))
 
     # ------------------------------------------------------------------
     # DELETE A product
@@ -180,7 +410,7 @@ class ProductResource(Resource):
         This endpoint will delete a product based the id specified in the path
         """
         app.logger.info("Request to Delete a product with id [%s]", product_id)
-        product = Product.find(product_id)
+        product = Product.find(product_id, cached=False)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
@@ -192,6 +422,57 @@ class ProductResource(Resource):
         return "", status.HTTP_204_NO_CONTENT
 
 
+######################################################################
+#  PATH: /products/search
+######################################################################
+@api.route("/products/search")
+class ProductSearch(Resource):
+    """Full-text search of the Products"""
+
+    @api.doc("search_products")
+    @api.expect(search_args, validate=True)
+    @api.response(200, "Success", [product_model])
+    @api.response(304, "Products not modified")
+    @api.response(400, "The search terms were not valid")
+    def get(self):
+        """
+        Search the Products
+
+        This endpoint returns the Products whose name and category have a
+        word starting with each of the words in q, best matches first.
+        """
+        args = search_args.parse_args()
+        app.logger.info("Request to search Products for [%s]", args["q"])
+        products, next_cursor = Product.search(
+            args["q"], limit=args["limit"] or app.config["PAGE_SIZE_DEFAULT"], cursor=args["cursor"]
+        )
+        return page_response(products, next_cursor)
+
+
+######################################################################
+#  PATH: /products/suggest
+######################################################################
+@api.route("/products/suggest")
+class ProductSuggest(Resource):
+    """Typeahead suggestions of Product names"""
+
+    @api.doc("suggest_products")
+    @api.expect(suggest_args, validate=True)
+    @api.response(200, "Success", [suggestion_model])
+    @api.response(400, "The prefix was not valid")
+    def get(self):
+        """
+        Suggest Product names
+
+        This endpoint returns the names that start with the prefix, in any
+        case, most liked first. They come from an index in memory, so the
+        database is not queried.
+        """
+        args = suggest_args.parse_args()
+        suggestions = Product.suggest(args["prefix"], args["limit"])
+        return json_response([{"name": name, "like": like, "count": count} for name, like, count in suggestions])
+
+
 ######################################################################
 #  PATH: /products/{product_id}/disable
 ######################################################################
@@ -220,7 +501,7 @@ class DisableResource(Resource):
         """
         app.logger.info("Request to disable product with id: %s", product_id)
 
-        product = Product.find(product_id)
+        product = Product.find(product_id, cached=False)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
@@ -230,7 +511,7 @@ class DisableResource(Resource):
         product.available = False
         product.update()
         app.logger.info("The [%s] has been disabled.", product.id)
-        return product.serialize(), status.HTTP_200_OK
+        return with_pending_likes(product.serialize()), status.HTTP_200_OK
 
 
 ######################################################################
@@ -261,7 +542,7 @@ class EnableResource(Resource):
         """
         app.logger.info("Request to enable product with id: %s", product_id)
 
-        product = Product.find(product_id)
+        product = Product.find(product_id, cached=False)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
@@ -271,7 +552,7 @@ class EnableResource(Resource):
         product.available = True
         product.update()
         app.logger.info("The [%s] has been enabled.", product.id)
-        return product.serialize(), status.HTTP_200_OK
+        return with_pending_likes(product.serialize()), status.HTTP_200_OK
 
 
 ######################################################################
@@ -298,16 +579,17 @@ class LikeResource(Resource):
         """
         app.logger.info("Request to like product with id: %s", product_id)
 
-        product = Product.find(product_id)
+        product = Product.find(product_id, cached=False)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Product with id '{product_id}' was not found.",
             )
-        product.like += 1
-        product.update()
+        # acknowledge right away, the like is written behind in a batch
+        likes.add(product.id)
+        Product.suggestions.change(product.name, likes=1)
         app.logger.info("Like count of product with id [%s] updated.", product.id)
-        return product.serialize(), status.HTTP_200_OK
+        return with_pending_likes(product.serialize()), status.HTTP_200_OK
 
 
 ######################################################################
@@ -333,7 +615,7 @@ class AdjustResource(Resource):
         """
         app.logger.info("Request to adjust inventory with id: %s", product_id)
 
-        product = Product.find(product_id)
+        product = Product.find(product_id, cached=False)
         if not product:
             abort(api.abort(404, f"Product with id '{product_id}' was not found."))
 
@@ -345,6 +627,9 @@ class AdjustResource(Resource):
         if not isinstance(inventory_change, int):
             abort(api.abort(400, "Inventory change value must be an integer."))
 
+        if product.inventory + inventory_change > INVENTORY_MAX:
+            abort(api.abort(400, f"Inventory cannot be more than {INVENTORY_MAX}."))
+
         product.inventory += inventory_change
         if product.inventory <= 0:
             product.inventory = 0
@@ -353,7 +638,62 @@ class AdjustResource(Resource):
         product.update()
 
         app.logger.info("Product Inventory with ID [%s] updated.", product.id)
-        return product.serialize(), status.HTTP_200_OK
+        return with_pending_likes(product.serialize()), status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /products/adjust_inventory
+######################################################################
+@api.route("/products/adjust_inventory")
+class AdjustBatchResource(Resource):
+    """
+    Adjust the Inventory of many Products at once
+    """
+
+    @api.doc(
+        "adjust_products_inventory",
+        responses={
+            404: "Product not found",
+            400: "Invalid input",
+            413: "Too many changes in one batch",
+            200: "Success",
+        },
+    )
+    @api.expect([adjust_item_model])
+    def put(self):
+        """
+        Update the Inventory of many Products
+
+        Every change is applied in one transaction, or none are.
+        Changes to the same Product are summed.
+        """
+        items = request.get_json()
+        if not isinstance(items, list):
+            abort(api.abort(400, "Inventory changes must be a JSON array."))
+        if len(items) > app.config["BATCH_MAX_ITEMS"]:
+            abort(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"Batch has more than {app.config['BATCH_MAX_ITEMS']} inventory changes.",
+            )
+        app.logger.info("Request to adjust inventory of %s products", len(items))
+
+        changes = {}
+        for position, item in enumerate(items):
+            if not isinstance(item, dict) or "id" not in item or "inventory_change" not in item:
+                abort(api.abort(400, f"Item {position}: id and inventory change value are required."))
+            if not is_integer(item["id"]) or not is_integer(item["inventory_change"]):
+                abort(api.abort(400, f"Item {position}: id and inventory change value must be integers."))
+            changes[item["id"]] = changes.get(item["id"], 0) + item["inventory_change"]
+            if abs(changes[item["id"]]) > INVENTORY_MAX:
+                abort(api.abort(400, f"Item {position}: inventory change cannot be more than {INVENTORY_MAX}."))
+
+        products, missing = Product.adjust_inventory(changes) if changes else ([], [])
+        if missing:
+            abort(api.abort(404, f"Products with ids {missing} were not found."))
+
+        app.logger.info("Inventory of %s products updated.", len(products))
+        results = [with_pending_likes(product.serialize()) for product in products]
+        return results, status.HTTP_200_OK
 
 
 # class AdjustResource(Resource):
@@ -405,7 +745,7 @@ class AdjustResource(Resource):
 ######################################################################
 #  PATH: /products/{product_id}/purchase
 ######################################################################
-@api.route("/products/<product_id>/purchase")
+@api.route("/products/<int:product_id>/purchase")
 @api.param("product_id", "The Product identifier")
 class PurchaseResource(Resource):
     """
@@ -414,8 +754,10 @@ class PurchaseResource(Resource):
 
     @api.doc("purchase_products")
     @api.response(200, "product purchased")
-    @api.expect(product_model)
-    @api.marshal_with(product_model)
+    @api.response(404, "Product not found")
+    @api.response(409, "Product is not available in that quantity")
+    @api.expect(purchase_args, validate=True)
+    @api.response(200, "Success", product_model)
     def put(self, product_id):
         """
         Purchase a Product
@@ -423,8 +765,16 @@ class PurchaseResource(Resource):
         This endpoint will purchase a Product
         """
         app.logger.info("Request to purchase product with id: %s", product_id)
+        quantity = purchase_args.parse_args()["quantity"]
+
+        # At this point you would execute code to purchase the product
+        # For the moment, we just take it out of inventory
+        product = Product.purchase(product_id, quantity)
+        if product:
+            return json_response(product_dict(product))
 
-        product = Product.find(product_id)
+        # Only a failed purchase pays for the lookup that explains why
+        product = Product.find(product_id, cached=False)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
@@ -435,16 +785,10 @@ class PurchaseResource(Resource):
                 status.HTTP_409_CONFLICT,
                 f"Product with id '{product_id}' is not available.",
             )
-
-        # At this point you would execute code to purchase the product
-        # For the moment, we will just set them to unavailable
-
-        product.inventory -= 1
-        if product.inventory == 0:
-            product.available = False
-        product.update()
-
-        return product.serialize(), status.HTTP_200_OK
+        abort(
+            status.HTTP_409_CONFLICT,
+            f"Product with id '{product_id}' has only {product.inventory} in inventory.",
+        )
 
 
 ######################################################################
@@ -459,29 +803,39 @@ class ProductCollection(Resource):
     # ------------------------------------------------------------------
     @api.doc("list_products")
     @api.expect(product_args, validate=True)
-    @api.marshal_list_with(product_model)
+    @api.response(200, "Success", [product_model])
+    @api.response(304, "Products not modified")
+    @api.produces(["application/json", NDJSON])
     def get(self):
-        """Returns all of the Products in the inventory"""
+        """Returns all of the Products in the inventory
+
+        Send the ETag back in If-None-Match to get a 304 while the page is unchanged.
+        """
         app.logger.info("Request to list Products inventory...")
 
-        products = []
         args = product_args.parse_args()
-        if args["category"]:
-            app.logger.info("Filtering by category: %s", args["category"])
-            products = Product.find_by_category(args["category"])
-        elif args["name"]:
-            app.logger.info("Filtering by name: %s", args["name"])
-            products = Product.find_by_name(args["name"])
-        elif args["available"] is not None:
-            app.logger.info("Filtering by availability: %s", args["available"])
-            products = Product.find_by_availability(args["available"])
-        else:
-            app.logger.info("Returning unfiltered list.")
-            products = Product.all()
+        query = Product.find_by_filters(**list_filters(args))
+        field_names = parse_fields(args["fields"])
+        columns = projected_columns(field_names, args["sort"])
+        if field_names:
+            query = Product.project(query, columns)
+
+        if args["stream"] or wants_ndjson():
+            app.logger.info("Streaming Products as NDJSON")
+            query = Product.keyset(query, sort=args["sort"], cursor=args["cursor"])
+            if args["limit"]:
+                query = query.limit(args["limit"])
+            products = Product.stream(query, app.config["STREAM_BATCH_SIZE"])
+            return app.response_class(
+                stream_with_context(ndjson_lines(products, field_names)),
+                status=status.HTTP_200_OK,
+                mimetype=NDJSON,
+            )
 
-        # app.logger.info('[%s] Products returned', len(products))
-        results = [product.serialize() for product in products]
-        return results, status.HTTP_200_OK
+        products, next_cursor = Product.paginate(
+            query, sort=args["sort"], limit=page_limit(args), cursor=args["cursor"]
+        )
+        return page_response(products, next_cursor, field_names, columns)
 
     # ------------------------------------------------------------------
     # Add a new product
@@ -489,7 +843,7 @@ class ProductCollection(Resource):
     @api.doc("create_products")
     @api.response(400, "The posted data was not valid")
     @api.expect(create_model)
-    @api.marshal_with(product_model, code=201)
+    @api.response(201, "Product created", product_model)
     def post(self):
         """
         Creates a Product
@@ -507,7 +861,60 @@ class ProductCollection(Resource):
             ProductResource, product_id=product.id, _external=True
         )
 
-        return product.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+        return json_response(
+            product_dict(product), status.HTTP_201_CREATED, {"Location": location_url}
+        )
+
+
+######################################################################
+#  PATH: /products/batch
+######################################################################
+@api.route("/products/batch")
+class ProductBatch(Resource):
+    """Creates many Products in one request"""
+
+    @api.doc("create_products_batch")
+    @api.expect([create_model], batch_args)
+    @api.response(201, "All of the Products were created", [batch_result_model])
+    @api.response(207, "Some of the Products were created", [batch_result_model])
+    @api.response(400, "None of the Products were created", [batch_result_model])
+    @api.response(413, "Too many Products in one batch")
+    def post(self):
+        """
+        Creates a batch of Products
+
+        With atomic=true (the default) either every Product is created or,
+        if any item is invalid, none are. With atomic=false each item
+        succeeds or fails on its own.
+        """
+        atomic = batch_args.parse_args()["atomic"]
+        items = api.payload
+        if not isinstance(items, list):
+            abort(status.HTTP_400_BAD_REQUEST, "Batch must be a JSON array of Products.")
+        if len(items) > app.config["BATCH_MAX_ITEMS"]:
+            abort(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"Batch has more than {app.config['BATCH_MAX_ITEMS']} Products.",
+            )
+        app.logger.info("Request to Create a batch of %s Products", len(items))
+
+        results, valid = deserialize_batch(items)
+        if atomic and len(valid) < len(items):
+            valid = {}
+        results.update(create_batch(valid, atomic))
+        results = [
+            results.get(position)
+            or batch_error(position, "Not created, the batch was rejected.")
+            for position in range(len(items))
+        ]
+
+        succeeded = sum(result["status"] == status.HTTP_201_CREATED for result in results)
+        app.logger.info("%s of %s Products created.", succeeded, len(items))
+        if succeeded == len(items):
+            return results, status.HTTP_201_CREATED
+        if succeeded:
+            return results, status.HTTP_207_MULTI_STATUS
+        return results, status.HTTP_400_BAD_REQUEST
 
 
 ######################################################################
@@ -515,6 +922,229 @@ class ProductCollection(Resource):
 ######################################################################
 
 
+def batch_error(position, message):
+    """Builds the result of a batch item that was not created"""
+    return {"index": position, "status": status.HTTP_400_BAD_REQUEST, "error": message}
+
+
+def deserialize_batch(items):
+    """Validates every item of a batch
+
+    Returns:
+        the errors of the invalid items and the valid Products, both keyed
+        by their position in the batch
+    """
+    errors = {}
+    products = {}
+    for position, data in enumerate(items):
+        try:
+            products[position] = Product().deserialize(data)
+        except DataValidationError as error:
+            errors[position] = batch_error(position, str(error))
+    return errors, products
+
+
+def create_batch(products, atomic):
+    """Inserts a batch of Products, one at a time if the batch is rejected
+
+    Args:
+        products (dict): the Products to create, keyed by their batch position
+        atomic (bool): if the whole batch must fail when any Product does
+    """
+    if not products:
+        return {}
+    try:
+        ids = Product.bulk_create(list(products.values()))
+        return {
+            position: {
+                "index": position,
+                "status": status.HTTP_201_CREATED,
+                "id": str(new_id),
+            }
+            for position, new_id in zip(products, ids)
+        }
+    except DataValidationError as error:
+        if atomic or len(products) == 1:
+            return {position: batch_error(position, str(error)) for position in products}
+    # find the rows the database rejected by retrying them one by one
+    results = {}
+    for position, product in products.items():
+        results.update(create_batch({position: product}, atomic))
+    return results
+
+
+def is_integer(value):
+    """Checks for a JSON integer, which unlike a Python int is not a bool"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def pending_likes(like, product_id):
+    """Adds the likes that are still buffered to a like count that is shown"""
+    return None if like is None else like + likes.pending(product_id)
+
+
+def with_pending_likes(data):
+    """Adds the likes that are still buffered to a serialized Product"""
+    data["like"] = pending_likes(data["like"], data["id"])
+    return data
+
+
+def list_filters(args):
+    """Picks the filters that were given out of the list query string"""
+    filters = {key: args[key] for key in PRODUCT_FILTERS if args[key] not in (None, "")}
+    if filters:
+        app.logger.info("Filtering by: %s", filters)
+    else:
+        app.logger.info("Returning unfiltered list.")
+    return filters
+
+
+def page_limit(args):
+    """Returns the page size asked for, the default one when following a cursor"""
+    if args["cursor"] and not args["limit"]:
+        return app.config["PAGE_SIZE_DEFAULT"]
+    return args["limit"]
+
+
+def product_response(product_id, product, field_names=None, columns=None):
+    """Sends a Product that was looked up, a 304 if unchanged, or a 404"""
+    if not product:
+        abort(
+            status.HTTP_404_NOT_FOUND,
+            f"product with id '{product_id}' was not found.",
+        )
+    headers = cache_validators([product], columns)
+    if not_modified(headers):
+        return app.response_class(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return json_response(product_dict(product, field_names), headers=headers)
+
+
+def page_response(products, next_cursor, field_names=None, columns=None):
+    """Sends a page of Products with its validators and next link, or a 304"""
+    headers = cache_validators(products, columns)
+    headers["Vary"] = "Accept"
+    if next_cursor:
+        headers["Link"] = next_page_link(next_cursor)
+    if not_modified(headers):
+        app.logger.info("[%s] Products not modified", len(products))
+        return app.response_class(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    app.logger.info("[%s] Products returned", len(products))
+    return json_response([product_dict(product, field_names) for product in products], headers=headers)
+
+
+def cache_validators(products, columns=None):
+    """Builds the ETag and Last-Modified headers of a list of Products
+
+    The strong ETag hashes the columns that are sent, every stored one by
+    default, and the buffered likes, so it changes whenever the
+    representation does. Last-Modified is the latest modified_date, which
+    only has the precision of a day and is not touched by purchases,
+    likes or inventory adjustments, so it is sent for information only.
+    """
+    columns = columns or PRODUCT_FIELDS
+    digest = hashlib.sha256()
+    for product in products:
+        values = [getattr(product, column) for column in columns]
+        digest.update(repr((values, likes.pending(product.id))).encode())
+    headers = {"ETag": quote_etag(digest.hexdigest()[:32]), "Cache-Control": "no-cache"}
+    dates = [getattr(product, "modified_date", None) for product in products]
+    dates = [modified for modified in dates if modified]
+    if dates:
+        headers["Last-Modified"] = http_date(datetime.combine(max(dates), time(), timezone.utc))
+    return headers
+
+
+def not_modified(headers):
+    """Checks If-None-Match against the ETag
+
+    If-Modified-Since alone never gives a 304, because Last-Modified does
+    not change on every write.
+    """
+    return not is_resource_modified(request.environ, etag=unquote_etag(headers["ETag"])[0])
+
+
+def wants_ndjson():
+    """Checks whether the client asked for newline delimited JSON"""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON])
+    return best == NDJSON
+
+
+def ndjson_lines(products, field_names=None):
+    """Serializes Products one line at a time as they are read"""
+    for product in products:
+        yield dumps(product_dict(product, field_names)) + b"\n"
+
+
+def parse_fields(value):
+    """Parses the fields query string argument into a tuple of field names"""
+    if not value:
+        return None
+    field_names = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in field_names if field not in PRODUCT_FIELDS]
+    if unknown:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"Unknown fields {unknown}, choose from {list(PRODUCT_FIELDS)}.",
+        )
+    return field_names or None
+
+
+def projected_columns(field_names, sort="id"):
+    """Returns the columns to select to serialize some fields of Products
+
+    The id is always read for the buffered likes and the cursor, the sort
+    key for the cursor, and modified_date because it decides if like is shown.
+    """
+    if not field_names:
+        return None
+    columns = dict.fromkeys(("id", sort.lstrip("-")) + field_names)
+    if "like" in field_names:
+        columns["modified_date"] = None
+    return list(columns)
+
+
+def product_dict(product, field_names=None):
+    """Serializes a Product in one pass into the shape of product_model
+
+    This is what marshal(with_pending_likes(product.serialize()),
+    product_model) returns, without building and walking a dict twice.
+    With field_names, only those keys are serialized, from a Product or from a
+    row that has at least the projected_columns() of them.
+    """
+    return {field: PRODUCT_FORMATS[field](product) for field in field_names or PRODUCT_FORMATS}
+
+
+# how product_dict() formats each field, in the order of product_model
+PRODUCT_FORMATS = {
+    "name": attrgetter("name"),
+    "price": lambda product: None if product.price is None else float(product.price),
+    "category": attrgetter("category"),
+    "inventory": attrgetter("inventory"),
+    "available": attrgetter("available"),
+    "created_date": lambda product: product.created_date.isoformat(),
+    "modified_date": lambda product: product.modified_date.isoformat(),
+    "like": lambda product: pending_likes(
+        product.like if product.modified_date is not None else None, product.id
+    ),
+    "disable": lambda product: product.disable or False,
+    "id": lambda product: str(product.id),
+}
+
+
+def json_response(data, code=status.HTTP_200_OK, headers=None):
+    """Sends data encoded once, straight to JSON bytes"""
+    return app.response_class(dumps(data), status=code, headers=headers, mimetype="application/json")
+
+
+def next_page_link(cursor):
+    """Builds the Link header that points at the next page of a list or search"""
+    args = request.args.to_dict()
+    args["cursor"] = cursor
+    url = url_for(request.endpoint, _external=True)
+    return f'<{url}?{urlencode(args)}>; rel="next"'
+
+
 # def check_content_type(content_type):
 #     """Checks that the media type is correct"""
 #     if "Content-Type" not in request.headers:
@@ -307,6 +307,35 @@ $(function () {
         clear_form_data()
     });
 
+    // ****************************************
+    // Suggest Product names while typing
+    // ****************************************
+
+    let suggestTimer = null;
+
+    $("#product_name").on("input", function () {
+        clearTimeout(suggestTimer);
+        let prefix = $(this).val();
+        if (!prefix) {
+            $("#product_name_suggestions").empty();
+            return;
+        }
+        // wait for a pause in typing before asking
+        suggestTimer = setTimeout(function () {
+            $.ajax({
+                type: "GET",
+                url: `/api/products/suggest?prefix=${encodeURIComponent(prefix)}`,
+                contentType: "application/json",
+                data: ''
+            }).done(function (res) {
+                let options = $("#product_name_suggestions").empty();
+                for (let i = 0; i < res.length; i++) {
+                    options.append($("<option>").val(res[i].name));
+                }
+            });
+        }, 150);
+    });
+
     // ****************************************
     // Search for a Product
     // ****************************************
@@ -320,7 +349,7 @@ $(function () {
         let queryString = ""
 
         if (name) {
-            queryString += 'name=' + name
+            queryString += 'name=' + encodeURIComponent(name)
         }
         if (category) {
             if (queryString.length > 0) {
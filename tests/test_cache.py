@@ -0,0 +1,63 @@
+"""
+Test cases for the LRU Cache
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from service.common.cache import LRUCache
+
+
+######################################################################
+#  L R U   C A C H E   T E S T   C A S E S
+######################################################################
+class TestLRUCache(TestCase):
+    """Test Cases for the LRU Cache"""
+
+    def test_hit_and_miss(self):
+        """It should count hits and misses"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        self.assertIsNone(cache.get(1))
+        cache.put(1, "one")
+        self.assertEqual(cache.get(1), "one")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_evict_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.put(1, "one")
+        cache.put(2, "two")
+        cache.get(1)
+        cache.put(3, "three")
+        self.assertEqual(cache.get(1), "one")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), "three")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expire_after_ttl(self):
+        """It should expire entries older than the TTL"""
+        cache = LRUCache(maxsize=2, ttl=5)
+        with patch("service.common.cache.time.monotonic", return_value=100.0):
+            cache.put(1, "one")
+        with patch("service.common.cache.time.monotonic", return_value=106.0):
+            self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_invalidate_and_clear(self):
+        """It should invalidate single keys and clear everything"""
+        cache = LRUCache(maxsize=4, ttl=60)
+        for key in range(3):
+            cache.put(key, key)
+        cache.invalidate(0, 99)
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.get(1), 1)
+        cache.clear()
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_disabled(self):
+        """It should not store anything when the size is 0"""
+        cache = LRUCache(maxsize=0)
+        cache.put(1, "one")
+        self.assertIsNone(cache.get(1))
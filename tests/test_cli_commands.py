@@ -2,10 +2,18 @@
 CLI Command Extensions for Flask
 """
 import os
+import csv
+import gzip
+import json
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
+from sqlalchemy import text
+from service import app
 from service.common.cli_commands import db_create
+from service.models import db, Product
+from tests.factories import ProductFactory
 
 
 class TestFlaskCLI(TestCase):
@@ -21,3 +29,201 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    def test_db_migrate(self):
+        """It should create missing indexes with the db-migrate command"""
+        db.session.execute(text("DROP INDEX IF EXISTS ix_product_name"))
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=["db-migrate"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Creating index ix_product_name", result.output)
+        self.assertIn("Index ix_product_category_available already exists", result.output)
+        self.assertIn("Query plans after migration", result.output)
+
+
+class TestProductsImport(TestCase):
+    """Test the products-import command"""
+
+    def setUp(self):
+        db.session.query(Product).delete()  # clean up the last tests
+        db.session.commit()
+        self.runner = app.test_cli_runner()
+        self.folder = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.records = [product.serialize() for product in ProductFactory.build_batch(7)]
+        for record in self.records:
+            del record["id"]
+
+    def tearDown(self):
+        self.folder.cleanup()
+        db.session.remove()
+
+    def _write_ndjson(self, records):
+        path = os.path.join(self.folder.name, "catalog.ndjson")
+        with open(path, "w", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        return path
+
+    def test_import_csv(self):
+        """It should import Products from a CSV file in chunks"""
+        path = os.path.join(self.folder.name, "catalog.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=list(self.records[0]))
+            writer.writeheader()
+            writer.writerows(self.records)
+        result = self.runner.invoke(args=["products-import", path, "--chunk-size", "3"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 7 rows, rejected 0 rows", result.output)
+        names = sorted(product.name for product in Product.all())
+        self.assertEqual(names, sorted(record["name"] for record in self.records))
+        found = Product.find_by_name(self.records[0]["name"]).first()
+        self.assertIsInstance(found.available, bool)
+
+    def test_import_ndjson_with_rejects(self):
+        """It should import the valid rows of an NDJSON file and report the rest"""
+        del self.records[2]["name"]
+        path = self._write_ndjson(self.records)
+        result = self.runner.invoke(args=["products-import", path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Row 3: Invalid Product: missing name", result.output)
+        self.assertIn("Imported 6 rows, rejected 1 rows", result.output)
+        self.assertEqual(len(Product.all()), 6)
+
+    def test_import_unparsable_rows(self):
+        """It should reject rows that are not JSON or have a bad date, and go on"""
+        self.records[3]["created_date"] = "2023-13-01"
+        path = self._write_ndjson(self.records)
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("{not json\n")
+        result = self.runner.invoke(args=["products-import", path, "--chunk-size", "2"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Row 4: Invalid Product: bad date", result.output)
+        self.assertIn("Row 8: ", result.output)
+        self.assertIn("Imported 6 rows, rejected 2 rows", result.output)
+        self.assertEqual(len(Product.all()), 6)
+
+    def test_import_csv_bad_number(self):
+        """It should reject a CSV row whose number does not parse"""
+        self.records[1]["price"] = "abc"
+        path = os.path.join(self.folder.name, "catalog.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=list(self.records[0]))
+            writer.writeheader()
+            writer.writerows(self.records)
+        result = self.runner.invoke(args=["products-import", path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Row 2: Invalid price: 'abc'", result.output)
+        self.assertEqual(len(Product.all()), 6)
+
+    def test_import_resume(self):
+        """It should resume an import from its checkpoint"""
+        path = self._write_ndjson(self.records)
+        checkpoint = os.path.join(self.folder.name, "catalog.ckpt")
+        with open(checkpoint, "w", encoding="utf-8") as file:
+            json.dump({"path": os.path.abspath(path), "rows": 4}, file)
+        args = ["products-import", path, "--checkpoint", checkpoint, "--chunk-size", "2"]
+        result = self.runner.invoke(args=args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Resuming after row 4", result.output)
+        self.assertEqual(len(Product.all()), 3)
+        with open(checkpoint, encoding="utf-8") as file:
+            self.assertEqual(json.load(file)["rows"], 7)
+        result = self.runner.invoke(args=args)
+        self.assertIn("Imported 0 rows", result.output)
+        self.assertEqual(len(Product.all()), 3)
+
+    def test_import_bad_checkpoint(self):
+        """It should not resume from the checkpoint of another file"""
+        path = self._write_ndjson(self.records)
+        checkpoint = os.path.join(self.folder.name, "catalog.ckpt")
+        with open(checkpoint, "w", encoding="utf-8") as file:
+            json.dump({"path": "/some/other/file", "rows": 4}, file)
+        result = self.runner.invoke(args=["products-import", path, "--checkpoint", checkpoint])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(Product.all(), [])
+
+    def test_import_rejected_chunk(self):
+        """It should stop when the database rejects a chunk"""
+        self.records[1]["price"] = None
+        path = self._write_ndjson(self.records)
+        result = self.runner.invoke(args=["products-import", path, "--chunk-size", "5"])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("Chunk rejected", result.output)
+
+    def test_import_rejected_chunk_bad_type(self):
+        """It should stop with a message when the database cannot take a value"""
+        self.records[1]["price"] = "abc"
+        path = self._write_ndjson(self.records)
+        result = self.runner.invoke(args=["products-import", path, "--chunk-size", "5"])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("Chunk rejected", result.output)
+        self.assertIsInstance(result.exception, SystemExit)
+
+    def test_import_copy(self):
+        """It should import Products with PostgreSQL COPY"""
+        path = self._write_ndjson(self.records)
+        result = self.runner.invoke(args=["products-import", path, "--copy"])
+        if db.engine.dialect.name != "postgresql":
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn("COPY requires PostgreSQL", result.output)
+            return
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(Product.all()), 7)
+
+    def test_import_copy_rejected_chunk(self):
+        """It should stop when the database rejects a chunk sent with COPY"""
+        self.records[6]["price"] = None
+        path = self._write_ndjson(self.records)
+        result = self.runner.invoke(args=["products-import", path, "--copy", "--chunk-size", "5"])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("Chunk rejected", result.output)
+        if db.engine.dialect.name != "postgresql":
+            self.assertIn("COPY requires PostgreSQL", result.output)
+            return
+        self.assertIn("rejected by the database", result.output)
+        self.assertEqual(len(Product.all()), 5)
+
+
+class TestProductsExport(TestCase):
+    """Test the products-export command"""
+
+    def setUp(self):
+        db.session.query(Product).delete()  # clean up the last tests
+        db.session.commit()
+        self.runner = app.test_cli_runner()
+        self.folder = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.products = ProductFactory.build_batch(5)
+        Product.bulk_create(self.products)
+
+    def tearDown(self):
+        self.folder.cleanup()
+        db.session.remove()
+
+    def test_export_ndjson_gzip(self):
+        """It should export every Product as gzipped NDJSON"""
+        path = os.path.join(self.folder.name, "catalog.ndjson.gz")
+        result = self.runner.invoke(args=["products-export", path, "--batch-size", "2"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Exported 5 rows", result.output)
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            data = [json.loads(line) for line in file]
+        self.assertEqual(data, [product.serialize() for product in self.products])
+
+    def test_export_csv_round_trip(self):
+        """It should export a CSV file that products-import can load"""
+        path = os.path.join(self.folder.name, "catalog.csv")
+        result = self.runner.invoke(args=["products-export", path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(path, newline="", encoding="utf-8") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual([row["name"] for row in rows], [p.name for p in self.products])
+        result = self.runner.invoke(args=["products-import", path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(Product.all()), 10)
+
+    def test_export_stdout(self):
+        """It should export to stdout"""
+        result = self.runner.invoke(args=["products-export", "-", "--format", "csv"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("id,name,price,category", result.output)
+        self.assertIn("Exported 5 rows", result.output)
@@ -0,0 +1,79 @@
+"""
+Test cases for Response Compression
+"""
+import gzip
+import os
+import tempfile
+import zlib
+from unittest import TestCase
+from flask import Flask
+from service.common.compression import (
+    Compressor,
+    available_encodings,
+    compress,
+    compress_chunks,
+    precompress_static,
+)
+
+
+######################################################################
+#  C O M P R E S S I O N   T E S T   C A S E S
+######################################################################
+class TestCompressor(TestCase):
+    """Test Cases for the Compressor"""
+
+    def test_compress_every_coding(self):
+        """It should compress in gzip and in every installed coding"""
+        data = b'{"name": "shirt"}\n' * 200
+        self.assertIn("gzip", available_encodings(["br", "zstd", "gzip", "compress"]))
+        for encoding in available_encodings(["br", "zstd", "gzip"]):
+            body = compress(data, encoding)
+            self.assertLess(len(body), len(data))
+            self.assertEqual(decompress(body, encoding), data)
+
+    def test_compress_chunks(self):
+        """It should flush every chunk of a stream so it can be read at once"""
+        compressor = Compressor("gzip")
+        chunks = compress_chunks(iter(["first\n", b"", b"second\n"]), compressor)
+        reader = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(reader.decompress(next(chunks)), b"first\n")
+        self.assertEqual(reader.decompress(next(chunks)), b"second\n")
+        self.assertEqual(reader.decompress(b"".join(chunks)), b"")
+        self.assertTrue(reader.eof)
+
+
+class TestPrecompressStatic(TestCase):
+    """Test Cases for compressing static files ahead of time"""
+
+    def test_precompress_static(self):
+        """It should compress the out of date static files that are large enough"""
+        with tempfile.TemporaryDirectory() as folder:
+            source = os.path.join(folder, "site.css")
+            with open(source, "w", encoding="utf-8") as file:
+                file.write("body { color: red; }\n" * 500)
+            with open(os.path.join(folder, "tiny.css"), "w", encoding="utf-8") as file:
+                file.write("p {}\n")
+            with open(os.path.join(folder, "logo.png"), "wb") as file:
+                file.write(b"\x89PNG" * 1000)
+            static = Flask(__name__, static_folder=folder)
+            static.config.update(COMPRESS_MIN_SIZE=1024, COMPRESS_ENCODINGS=["gzip"])
+            written = precompress_static(static)
+            self.assertEqual(written, [(source + ".gz", "gzip", 10500, os.path.getsize(source + ".gz"))])
+            with gzip.open(source + ".gz") as file:
+                self.assertEqual(file.read(), b"body { color: red; }\n" * 500)
+            self.assertEqual(precompress_static(static), [])
+            self.assertEqual(len(precompress_static(static, min_size=1)), 1)
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def decompress(body, encoding):
+    """Decompresses a body in any coding the service produces"""
+    if encoding == "br":
+        import brotli  # pylint: disable=import-outside-toplevel
+        return brotli.decompress(body)
+    if encoding == "zstd":
+        import zstandard  # pylint: disable=import-outside-toplevel
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return gzip.decompress(body)
@@ -0,0 +1,108 @@
+"""
+Test cases for the write-behind Like Buffer
+"""
+import logging
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy.exc import OperationalError
+from service import app
+from service.common.like_buffer import LikeBuffer
+from service.models import db, Product
+from tests.factories import ProductFactory
+
+
+######################################################################
+#  L I K E   B U F F E R   T E S T   C A S E S
+######################################################################
+class TestLikeBuffer(TestCase):
+    """Test Cases for the Like Buffer"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """This runs before each test"""
+        db.session.query(Product).delete()  # clean up the last tests
+        db.session.commit()
+        self.product = ProductFactory()
+        self.product.create()
+        self.like = self.product.like
+
+    def tearDown(self):
+        """This runs after each test"""
+        db.session.remove()
+
+    def _stored_likes(self):
+        db.session.expire_all()
+        return Product.find(self.product.id).like
+
+    def test_flush_on_interval(self):
+        """It should flush summed likes from the background thread"""
+        buffer = LikeBuffer()
+        with patch.dict(app.config, {"LIKE_FLUSH_INTERVAL": 0.01}):
+            buffer.start(app)
+        buffer.add(self.product.id)
+        buffer.add(self.product.id, 2)
+        self.assertEqual(buffer.pending(self.product.id), 3)
+        buffer.stop()
+        self.assertEqual(buffer.pending(self.product.id), 0)
+        self.assertEqual(self._stored_likes(), self.like + 3)
+
+    def test_write_through(self):
+        """It should write likes at once when the interval is zero"""
+        buffer = LikeBuffer()
+        with patch.dict(app.config, {"LIKE_FLUSH_INTERVAL": 0}):
+            buffer.start(app)
+        buffer.add(self.product.id)
+        self.assertEqual(buffer.pending(self.product.id), 0)
+        self.assertEqual(self._stored_likes(), self.like + 1)
+
+    def test_flush_failure_keeps_likes(self):
+        """It should keep likes that could not be flushed for the next try"""
+        buffer = LikeBuffer()
+        buffer.app = app
+        buffer.interval = 60
+        buffer.add(self.product.id, 4)
+        error = OperationalError("UPDATE", {}, Exception("database is down"))
+        with patch.object(Product, "add_likes", side_effect=error):
+            buffer.flush()
+        self.assertEqual(buffer.pending(self.product.id), 4)
+        buffer.flush()
+        self.assertEqual(buffer.pending(self.product.id), 0)
+        self.assertEqual(self._stored_likes(), self.like + 4)
+
+    def test_clear(self):
+        """It should discard buffered likes"""
+        buffer = LikeBuffer()
+        buffer.interval = 60
+        buffer.add(self.product.id)
+        buffer.clear()
+        self.assertEqual(buffer.pending(self.product.id), 0)
+        buffer.flush()
+
+    def test_concurrent_flushes(self):
+        """It should count likes once while another flush is in flight"""
+        buffer = LikeBuffer()
+        buffer.app = app
+        buffer.interval = 60
+        buffer.add(self.product.id, 2)
+        add_likes = Product.add_likes
+        racer = threading.Thread(target=buffer.flush)
+
+        def slow_add_likes(deltas):
+            buffer.add(self.product.id, 3)
+            racer.start()
+            racer.join(0.05)
+            self.assertTrue(racer.is_alive())  # waits for this flush
+            self.assertEqual(buffer.pending(self.product.id), 5)
+            add_likes(deltas)
+
+        with patch.object(Product, "add_likes", side_effect=slow_add_likes):
+            buffer.flush()
+        racer.join()
+        self.assertEqual(buffer.pending(self.product.id), 0)
+        self.assertEqual(self._stored_likes(), self.like + 5)
@@ -5,6 +5,7 @@ Test cases for Product Model
 import os
 import logging
 import unittest
+from unittest.mock import patch
 from datetime import date
 from service import app
 from service.models import Product, DataValidationError, db
@@ -242,3 +243,337 @@ class TestYProduct(unittest.TestCase):
         self.assertEqual(found.count(), count)
         for product in found:
             self.assertEqual(product.available, available)
+
+    def test_paginate(self):
+        """It should page through Products with a keyset cursor"""
+        products = ProductFactory.create_batch(5)
+        for product in products:
+            product.create()
+        page, cursor = Product.paginate(Product.query, limit=2)
+        self.assertEqual([p.id for p in page], [products[0].id, products[1].id])
+        self.assertIsNotNone(cursor)
+        page, cursor = Product.paginate(Product.query, limit=2, cursor=cursor)
+        self.assertEqual([p.id for p in page], [products[2].id, products[3].id])
+        page, cursor = Product.paginate(Product.query, limit=2, cursor=cursor)
+        self.assertEqual([p.id for p in page], [products[4].id])
+        self.assertIsNone(cursor)
+
+    def test_paginate_by_sort_key(self):
+        """It should page through Products sorted by a date column"""
+        products = ProductFactory.create_batch(4)
+        for i, product in enumerate(products):
+            product.created_date = date(2023, 1, 4 - i)
+            product.create()
+        page, cursor = Product.paginate(Product.query, sort="created_date", limit=3)
+        self.assertEqual([p.id for p in page], [p.id for p in reversed(products)][:3])
+        page, cursor = Product.paginate(
+            Product.query, sort="created_date", limit=3, cursor=cursor
+        )
+        self.assertEqual([p.id for p in page], [products[0].id])
+        self.assertIsNone(cursor)
+
+    def test_paginate_bad_cursor(self):
+        """It should not page with a bad sort key or cursor"""
+        self.assertRaises(DataValidationError, Product.paginate, Product.query, sort="name")
+        self.assertRaises(DataValidationError, Product.decode_cursor, "junk")
+        product = ProductFactory()
+        cursor = Product.encode_cursor(product, "price")
+        self.assertRaises(DataValidationError, Product.decode_cursor, cursor, "-price")
+
+    def test_stream(self):
+        """It should stream Products in batches"""
+        products = ProductFactory.create_batch(5)
+        for product in products:
+            product.create()
+        query = Product.keyset(Product.query)
+        found = list(Product.stream(query, batch_size=2))
+        self.assertEqual([p.id for p in found], [p.id for p in products])
+
+    def test_find_by_filters(self):
+        """It should Find Products matching several filters at once"""
+        products = ProductFactory.create_batch(20)
+        for product in products:
+            product.create()
+        category = products[0].category
+        expected = [
+            product.id
+            for product in products
+            if product.category == category
+            and product.disable is False
+            and 15 <= product.price <= 45
+            and 5 <= product.inventory <= 30
+        ]
+        found = Product.find_by_filters(
+            category=category,
+            disable=False,
+            min_price=15,
+            max_price=45,
+            min_inventory=5,
+            max_inventory=30,
+        )
+        self.assertEqual(sorted(product.id for product in found), sorted(expected))
+        self.assertEqual(Product.find_by_filters().count(), 20)
+
+    def test_purchase(self):
+        """It should Purchase inventory of an available Product"""
+        product = ProductFactory(inventory=3, available=True)
+        product.create()
+        purchased = Product.purchase(product.id, 2)
+        self.assertEqual(purchased.id, product.id)
+        self.assertEqual(purchased.inventory, 1)
+        self.assertTrue(purchased.available)
+        self.assertIsNone(Product.purchase(product.id, 2))
+        purchased = Product.purchase(product.id)
+        self.assertEqual(purchased.inventory, 0)
+        self.assertFalse(purchased.available)
+        found = Product.find(product.id)
+        self.assertEqual(found.inventory, 0)
+        self.assertFalse(found.available)
+        self.assertIsNone(Product.purchase(product.id))
+        self.assertIsNone(Product.purchase(0))
+
+    def test_add_likes(self):
+        """It should add likes to many Products in one batch"""
+        products = ProductFactory.create_batch(3)
+        for product in products:
+            product.create()
+        expected = [product.like for product in products]
+        Product.add_likes({products[0].id: 5, products[2].id: 1})
+        db.session.expire_all()
+        found = [Product.find(product.id).like for product in products]
+        self.assertEqual(found, [expected[0] + 5, expected[1], expected[2] + 1])
+
+    def test_find_cached(self):
+        """It should serve a repeated find from the cache"""
+        product = ProductFactory()
+        product.create()
+        db.session.expunge_all()
+        Product.find(product.id)
+        hits = Product.cache.stats()["hits"]
+        db.session.expunge_all()
+        found = Product.find(str(product.id))
+        self.assertEqual(Product.cache.stats()["hits"], hits + 1)
+        self.assertEqual(found.serialize(), product.serialize())
+        found.inventory = 99
+        found.update()
+        db.session.expunge_all()
+        self.assertEqual(Product.find(product.id).inventory, 99)
+
+    def test_find_cache_invalidated(self):
+        """It should not serve stale Products from the cache after writes"""
+        product = ProductFactory(available=True, inventory=5)
+        product.create()
+        like = product.like
+        self.assertEqual(Product.find(product.id).inventory, 5)
+        Product.purchase(product.id, 2)
+        self.assertEqual(Product.find(product.id).inventory, 3)
+        Product.adjust_inventory({product.id: 4})
+        self.assertEqual(Product.find(product.id).inventory, 7)
+        Product.add_likes({product.id: 1})
+        self.assertEqual(Product.find(product.id).like, like + 1)
+        db.session.query(Product).filter(Product.id == product.id).delete()
+        db.session.commit()
+        self.assertIsNone(Product.find(product.id))
+
+    def test_find_invalid_id(self):
+        """It should not cache lookups of ids that are not integers"""
+        self.assertIsNone(Product.find(None))
+        self.assertEqual(Product.cache.stats()["size"], 0)
+
+    def test_project(self):
+        """It should select only some columns of Products"""
+        products = ProductFactory.create_batch(3)
+        for product in products:
+            product.create()
+        rows = Product.project(Product.query.order_by(Product.id), ["id", "name"]).all()
+        self.assertEqual([tuple(row) for row in rows], [(p.id, p.name) for p in products])
+        self.assertFalse(any(isinstance(row, Product) for row in rows))
+
+    def test_find_columns(self):
+        """It should find some columns of a Product by its id"""
+        product = ProductFactory()
+        product.create()
+        Product.cache.clear()
+        row = Product.find_columns(product.id, ["id", "price"])
+        self.assertEqual(tuple(row), (product.id, product.price))
+        Product.find(product.id)  # now it is cached
+        self.assertEqual(Product.find_columns(str(product.id), ["id"]).name, product.name)
+        self.assertIsNone(Product.find_columns(0, ["id"]))
+        self.assertIsNone(Product.find_columns("foo", ["id"]))
+
+    def test_create_schema(self):
+        """It should create the schema only when it is missing"""
+        product = ProductFactory()
+        product.create()
+        self.assertFalse(Product.create_schema())
+        self.assertEqual(len(Product.all()), 1)
+        db.session.remove()
+        db.drop_all()
+        self.assertTrue(Product.create_schema())
+        self.assertEqual(Product.all(), [])
+
+    def test_bulk_create(self):
+        """It should Create many Products in one transaction"""
+        products = ProductFactory.build_batch(5)
+        ids = Product.bulk_create(products)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids, [product.id for product in products])
+        self.assertEqual(len(Product.all()), 5)
+
+    def test_bulk_create_rejected(self):
+        """It should not Create any of a batch the database rejects"""
+        products = ProductFactory.build_batch(3)
+        products[1].price = None
+        self.assertRaises(DataValidationError, Product.bulk_create, products)
+        self.assertEqual(Product.all(), [])
+
+    def test_adjust_inventory(self):
+        """It should adjust the inventory of many Products in one UPDATE"""
+        products = ProductFactory.create_batch(2, inventory=4, available=True)
+        for product in products:
+            product.create()
+        adjusted, missing = Product.adjust_inventory(
+            {products[0].id: 3, products[1].id: -9}
+        )
+        self.assertEqual(missing, [])
+        adjusted = {product.id: product for product in adjusted}
+        self.assertEqual(adjusted[products[0].id].inventory, 7)
+        self.assertEqual(adjusted[products[1].id].inventory, 0)
+        self.assertFalse(adjusted[products[1].id].available)
+        adjusted, missing = Product.adjust_inventory({products[0].id: 1, 0: 1})
+        self.assertEqual((adjusted, missing), ([], [0]))
+        db.session.expire_all()
+        self.assertEqual(Product.find(products[0].id).inventory, 7)
+        self.assertRaises(DataValidationError, Product.adjust_inventory, {products[0].id: None})
+        db.session.expire_all()
+        self.assertEqual(Product.find(products[0].id).inventory, 7)
+
+    def test_search(self):
+        """It should find Products by the start of words in their name and category"""
+        coke = ProductFactory(name="Coke Zero", category="beverage")
+        coconut = ProductFactory(name="Coconut Milk", category="dairy")
+        milk = ProductFactory(name="Milk", category="dairy")
+        for product in (coke, coconut, milk):
+            product.create()
+        self.assertEqual(Product.search("coke", limit=10), ([coke], None))
+        self.assertEqual(Product.search("CO", limit=10)[0], [coke, coconut])
+        self.assertEqual(Product.search("milk dai", limit=10)[0], sorted([coconut, milk], key=lambda product: product.id))
+        self.assertEqual(Product.search("zero milk", limit=10), ([], None))
+        self.assertRaises(DataValidationError, Product.search, " !? ", 10)
+
+    def test_search_pages(self):
+        """It should page through the results of a search"""
+        products = ProductFactory.build_batch(5, name="Kale", category="vegetable")
+        Product.bulk_create(products)
+        page, cursor = Product.search("kale", limit=2)
+        seen = [product.id for product in page]
+        while cursor:
+            page, cursor = Product.search("kale", limit=2, cursor=cursor)
+            seen.extend(product.id for product in page)
+        self.assertEqual(seen, sorted(product.id for product in products))
+        _, cursor = Product.search("kale", limit=2)
+        self.assertRaises(DataValidationError, Product.search, "vegetable", 2, cursor)
+        self.assertRaises(DataValidationError, Product.search, "kale", 2, "garbage")
+
+    def test_search_follows_writes(self):
+        """It should keep search up to date as Products change"""
+        product = ProductFactory(name="Apple", category="fruit")
+        product.create()
+        self.assertEqual(Product.search("apple", limit=10)[0], [product])
+        product.name = "Pear"
+        product.update()
+        self.assertEqual(Product.search("apple", limit=10)[0], [])
+        self.assertEqual(Product.search("pear", limit=10)[0], [product])
+        Product.bulk_insert(ProductFactory.build_batch(2, name="Pear"))
+        self.assertEqual(len(Product.search("pear", limit=10)[0]), 3)
+        product.delete()
+        self.assertEqual(len(Product.search("pear", limit=10)[0]), 2)
+        db.session.query(Product).delete()
+        db.session.commit()
+        self.assertEqual(Product.search("pear", limit=10)[0], [])
+
+    def test_search_max_matches(self):
+        """It should rank and page through at most search_max_matches Products"""
+        Product.bulk_create(ProductFactory.build_batch(5, name="Milk", category="dairy"))
+        Product.search_max_matches = 3
+        try:
+            page, cursor = Product.search("milk", limit=2)
+            self.assertEqual(len(page), 2)
+            page, cursor = Product.search("milk", limit=2, cursor=cursor)
+            self.assertEqual((len(page), cursor), (1, None))
+            cursor = Product.encode_search_cursor(["milk"], 3)
+            self.assertEqual(Product.search("milk", limit=2, cursor=cursor), ([], None))
+        finally:
+            Product.search_max_matches = app.config["SEARCH_MAX_MATCHES"]
+
+    def test_search_max_matches_best_first(self):
+        """It should keep the best search_max_matches matches, not any of them"""
+        Product.bulk_create(ProductFactory.build_batch(3, name="Milkshake", category="dairy"))
+        Product.bulk_create(ProductFactory.build_batch(2, name="Milk Milk", category="milk"))
+        best, _ = Product.search("milk", limit=10)
+        Product.search_max_matches = 2
+        try:
+            self.assertEqual(Product.search("milk", limit=10), (best[:2], None))
+            self.assertEqual({product.name for product in best[:2]}, {"Milk Milk"})
+        finally:
+            Product.search_max_matches = app.config["SEARCH_MAX_MATCHES"]
+
+    def test_suggest_write_during_refresh(self):
+        """It should not lose a Product created while the suggestions are read"""
+        load = Product.suggestion_rows
+
+        def racing_load():
+            rows = load()
+            ProductFactory(name="Zucchini", like=2).create()
+            return rows
+
+        with patch.object(Product.suggestions, "_load", racing_load):
+            Product.suggestions.refresh()
+        self.assertFalse(Product.suggestions.ready)
+        self.assertEqual(Product.suggest("zu"), [("Zucchini", 2, 1)])
+
+    def test_search_follows_bulk_updates(self):
+        """It should rebuild the in-process indexes after a bulk UPDATE"""
+        product = ProductFactory(name="Apple", category="fruit")
+        product.create()
+        self.assertEqual(Product.search("apple", limit=10)[0], [product])
+        db.session.query(Product).update({"name": "Pear"})
+        db.session.commit()
+        self.assertEqual(Product.search("pear", limit=10)[0], [product])
+        self.assertEqual([name for name, _, _ in Product.suggest("p")], ["Pear"])
+
+    def test_suggest(self):
+        """It should suggest the names that start with a prefix, most liked first"""
+        Product.bulk_create(
+            [
+                ProductFactory.build(name="Coke", like=5),
+                ProductFactory.build(name="coke", like=4),
+                ProductFactory.build(name="Coconut Milk", like=7),
+                ProductFactory.build(name="Milk", like=1),
+            ]
+        )
+        self.assertEqual(Product.suggest("co"), [("Coke", 9, 2), ("Coconut Milk", 7, 1)])
+        self.assertEqual(Product.suggest("CO", limit=1), [("Coke", 9, 2)])
+        self.assertEqual(Product.suggest("milk"), [("Milk", 1, 1)])
+        self.assertEqual(Product.suggest("tea"), [])
+        self.assertEqual(Product.suggest(""), [])
+
+    def test_suggest_follows_writes(self):
+        """It should keep suggestions up to date as Products change"""
+        product = ProductFactory(name="Apple", like=3)
+        product.create()
+        self.assertEqual(Product.suggest("a"), [("Apple", 3, 1)])
+        product.name = "Apricot"
+        product.like = 10
+        product.update()
+        self.assertEqual(Product.suggest("a"), [("Apricot", 10, 1)])
+        other = ProductFactory(name="Avocado", like=20)
+        other.create()
+        self.assertEqual(Product.suggest("a"), [("Avocado", 20, 1), ("Apricot", 10, 1)])
+        other.delete()
+        self.assertEqual(Product.suggest("a"), [("Apricot", 10, 1)])
+        Product.bulk_insert(ProductFactory.build_batch(2, name="Apricot", like=1))
+        self.assertEqual(Product.suggest("apr"), [("Apricot", 12, 3)])
+        db.session.query(Product).delete()
+        db.session.commit()
+        self.assertEqual(Product.suggest("a"), [])
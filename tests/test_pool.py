@@ -0,0 +1,60 @@
+"""
+Test cases for the Connection Pool Telemetry
+"""
+from unittest import TestCase
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import QueuePool, StaticPool
+from service.common.pool import TimedQueuePool, pool_stats
+
+
+######################################################################
+#  P O O L   T E S T   C A S E S
+######################################################################
+class TestTimedQueuePool(TestCase):
+    """Test Cases for the Timed Queue Pool"""
+
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+        )
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_checkouts(self):
+        """It should count checkouts and report the live pool state"""
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            stats = pool_stats(self.engine)
+            self.assertEqual(stats["checked_out"], 1)
+        stats = pool_stats(self.engine)
+        self.assertEqual(stats["class"], "TimedQueuePool")
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checked_in"], 1)
+        self.assertEqual(stats["checkouts"], 1)
+        self.assertEqual(stats["average_wait_seconds"], stats["wait_seconds"])
+
+    def test_timeouts(self):
+        """It should count the checkouts that time out waiting"""
+        with self.engine.connect():
+            self.assertRaises(exc.TimeoutError, self.engine.connect)
+        stats = pool_stats(self.engine)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertGreaterEqual(stats["max_wait_seconds"], 0.05)
+
+    def test_recreate(self):
+        """It should keep timing after the pool is recreated"""
+        self.engine.dispose()
+        self.assertIsInstance(self.engine.pool, TimedQueuePool)
+        self.assertEqual(pool_stats(self.engine)["checkouts"], 0)
+
+    def test_other_pools(self):
+        """It should report the status of pools that are not queues"""
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        self.assertEqual(pool_stats(engine)["class"], "StaticPool")
+        self.assertIn("status", pool_stats(engine))
+        stats = pool_stats(create_engine("sqlite://", poolclass=QueuePool, pool_size=2))
+        self.assertEqual(stats["size"], 2)
+        self.assertNotIn("checkouts", stats)
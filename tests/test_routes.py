@@ -5,14 +5,26 @@ Test cases can be run with the following:
   nosetests -v --with-spec --spec-color
   coverage report -m
 """
+# pylint: disable=too-many-lines
 import os
+import base64
+import gzip
+import json
 import logging
+import subprocess
+import sys
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
 from datetime import date
 from urllib.parse import quote_plus
+from flask_restx import marshal
 from service import app
-from service.models import db, init_db, Product
+from service.models import db, init_db, Product, INVENTORY_MAX
+from service.routes import product_dict, product_model
 from service.common import status  # HTTP Status Codes
+from service.common.compression import available_encodings
+from service.common.like_buffer import likes
 from tests.factories import ProductFactory
 
 DATABASE_URI = os.getenv(
@@ -46,6 +58,7 @@ class TestYourResourceServer(TestCase):
     def setUp(self):
         """This runs before each test"""
         self.client = app.test_client()
+        likes.clear()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
 
@@ -79,6 +92,55 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         data = resp.get_json()
         self.assertEqual(data["status"], "OK")
+        self.assertIn("hits", data["cache"])
+        self.assertIn("class", data["pool"])
+        self.assertGreater(data["startup"]["ready_seconds"], 0)
+        self.assertIn("database", data["startup"]["phases"])
+
+    def test_metrics(self):
+        """It should count and time the requests of each resource"""
+        test_product = self._create_products(1)[0]
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.client.get(f"{BASE_URL}/0")
+        self.client.get("/no/such/path")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        body = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="GET",resource="ProductResource",status="200"}', body)
+        self.assertIn('http_requests_total{method="GET",resource="ProductResource",status="404"}', body)
+        self.assertIn('http_requests_total{method="GET",resource="unmatched",status="404"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{le="0.005",method="POST",resource="ProductCollection"}', body)
+        self.assertIn('http_request_db_seconds_count{method="GET",resource="ProductResource"}', body)
+
+    def test_server_timing(self):
+        """It should report the statements and time of a request in Server-Timing"""
+        test_product = self._create_products(1)[0]
+        with self.assertLogs(app.logger, "INFO") as logs:
+            response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        database, application = response.headers["Server-Timing"].split(", ")
+        self.assertTrue(database.startswith("db;dur="))
+        self.assertRegex(database, r'desc="\d+ statements"$')
+        self.assertTrue(application.startswith("app;dur="))
+        self.assertTrue(any(f"GET {BASE_URL}/{test_product.id} 200 in" in line for line in logs.output))
+
+    def test_metrics_multiprocess(self):
+        """It should add up the metrics that every worker wrote"""
+        worker = (
+            "from prometheus_client import Counter; "
+            "Counter('worker_requests', 'Requests', ['resource']).labels('ProductResource').inc({})"
+        )
+        with tempfile.TemporaryDirectory() as folder:
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": folder}):
+                response = self.client.get("/metrics")
+                self.assertEqual(response.data, b"")
+                for count in (2, 3):  # two workers, each with its own pid
+                    subprocess.run([sys.executable, "-c", worker.format(count)], check=True)
+                self.assertEqual(len(os.listdir(folder)), 2)
+                response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'worker_requests_total{resource="ProductResource"} 5.0', response.data)
 
     def test_index(self):
         """It should call the home page"""
@@ -93,6 +155,94 @@ class TestYourResourceServer(TestCase):
         data = response.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_get_product_list_paged(self):
+        """It should page through the Product list with a cursor"""
+        products = self._create_products(7)
+        seen = []
+        response = self.client.get(BASE_URL, query_string="limit=3")
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.get_json()
+            self.assertLessEqual(len(data), 3)
+            seen.extend(int(product["id"]) for product in data)
+            link = response.headers.get("Link")
+            if not link:
+                break
+            self.assertIn('rel="next"', link)
+            next_url = link[link.index("<") + 1:link.index(">")]
+            response = self.client.get(next_url)
+        self.assertEqual(seen, sorted(int(product.id) for product in products))
+
+    def test_get_product_list_sorted(self):
+        """It should page through the Product list sorted by price descending"""
+        products = self._create_products(5)
+        response = self.client.get(BASE_URL, query_string="sort=-price&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        prices = [product["price"] for product in response.get_json()]
+        link = response.headers.get("Link")
+        next_url = link[link.index("<") + 1:link.index(">")]
+        response = self.client.get(next_url)
+        prices += [product["price"] for product in response.get_json()]
+        expected = sorted((product.price for product in products), reverse=True)
+        self.assertEqual(prices, expected[:4])
+
+    def test_get_product_list_bad_cursor(self):
+        """It should not Get a page of Products with a bad cursor"""
+        response = self.client.get(BASE_URL, query_string="cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_list_forged_cursor(self):
+        """It should not Get a page with a cursor whose values have the wrong types"""
+        self._create_products(2)
+        forged = [
+            ("price", ["price", {"a": 1}, 1]),
+            ("id", ["id", None, "abc"]),
+            ("category", ["category", 5, 1]),
+            ("created_date", ["created_date", "2023-01-01", True]),
+            ("inventory", ["inventory", 1.5, 1]),
+        ]
+        for sort, payload in forged:
+            cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = self.client.get(BASE_URL, query_string={"sort": sort, "cursor": cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+        cursor = base64.urlsafe_b64encode(json.dumps(["price", 3, 1]).encode()).decode()
+        response = self.client.get(BASE_URL, query_string={"sort": "price", "cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bad_data_without_testing(self):
+        """It should answer bad data with 400 when exceptions do not propagate"""
+        with patch.dict(app.config, {"TESTING": False}):
+            response = self.client.get(BASE_URL, query_string="cursor=garbage")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("cursor", response.get_json()["message"])
+            response = self.client.get(f"{BASE_URL}/search", query_string="q=%26%7C")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_product_list(self):
+        """It should stream the Product list as NDJSON"""
+        products = self._create_products(5)
+        response = self.client.get(BASE_URL, query_string="stream=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 5)
+        data = [json.loads(line) for line in lines]
+        self.assertEqual([product["name"] for product in data], [p.name for p in products])
+
+    def test_stream_product_list_accept(self):
+        """It should stream the Product list when the client accepts NDJSON"""
+        self._create_products(4)
+        response = self.client.get(
+            BASE_URL,
+            query_string="limit=3",
+            headers={"Accept": "application/x-ndjson"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 3)
+
     def test_query_product_list_by_category(self):
         """It should Query Product by Category"""
         products = self._create_products(10)
@@ -176,6 +326,48 @@ class TestYourResourceServer(TestCase):
         for product in data:
             self.assertEqual(product["available"], False)
 
+    def test_query_product_list_by_many_filters(self):
+        """It should Query Products by every filter at once"""
+        products = self._create_products(20)
+        test_category = products[0].category
+        expected = [
+            product
+            for product in products
+            if product.category == test_category
+            and product.available is True
+            and product.disable is False
+            and 20 <= product.price <= 50
+            and product.inventory >= 10
+        ]
+        response = self.client.get(
+            BASE_URL,
+            query_string={
+                "category": test_category,
+                "available": "true",
+                "disable": "false",
+                "min_price": 20,
+                "max_price": 50,
+                "min_inventory": 10,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(
+            sorted(int(product["id"]) for product in data),
+            sorted(int(product.id) for product in expected),
+        )
+
+    def test_query_product_list_by_inventory(self):
+        """It should Query Products by an inventory range"""
+        products = self._create_products(10)
+        low_stock = [product for product in products if product.inventory <= 5]
+        response = self.client.get(BASE_URL, query_string="max_inventory=5")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), len(low_stock))
+        for product in data:
+            self.assertLessEqual(product["inventory"], 5)
+
     def test_get_product(self):
         """It should Get a single Product"""
         # get the id of a product
@@ -185,6 +377,160 @@ class TestYourResourceServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["name"], test_product.name)
 
+    def test_get_product_not_modified(self):
+        """It should return 304 for a Product whose ETag has not changed"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        self.assertIn("Last-Modified", response.headers)
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.data, b"")
+        # a change to the Product changes its ETag
+        self.client.put(
+            f"{BASE_URL}/{test_product.id}/adjust_inventory", json={"inventory_change": 1}
+        )
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        # so does a like that is still buffered
+        etag = response.headers["ETag"]
+        likes.add(int(test_product.id))
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_product_if_modified_since(self):
+        """It should not return 304 for If-Modified-Since after a write"""
+        product = ProductFactory(inventory=10, available=True)
+        product.create()
+        response = self.client.get(f"{BASE_URL}/{product.id}")
+        last_modified = response.headers["Last-Modified"]
+        list_modified = self.client.get(BASE_URL).headers["Last-Modified"]
+        # a purchase does not change modified_date
+        response = self.client.put(f"{BASE_URL}/{product.id}/purchase", query_string="quantity=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/{product.id}", headers={"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Last-Modified"], last_modified)
+        self.assertEqual(response.get_json()["inventory"], 9)
+        response = self.client.get(BASE_URL, headers={"If-Modified-Since": list_modified})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()[0]["inventory"], 9)
+        # only the ETag decides
+        etag = self.client.get(f"{BASE_URL}/{product.id}").headers["ETag"]
+        response = self.client.get(
+            f"{BASE_URL}/{product.id}", headers={"If-Modified-Since": last_modified, "If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_product_list_not_modified(self):
+        """It should return 304 for a list of Products that has not changed"""
+        products = self._create_products(3)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            BASE_URL, query_string="limit=2", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn("Link", response.headers)
+        response = self.client.get(
+            BASE_URL, query_string="limit=2", headers={"If-None-Match": f'W/{etag}'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.put(
+            f"{BASE_URL}/{products[0].id}/adjust_inventory", json={"inventory_change": 1}
+        )
+        response = self.client.get(
+            BASE_URL, query_string="limit=2", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 2)
+
+    def test_product_dict(self):
+        """It should serialize a Product exactly as marshalling product_model does"""
+        product = ProductFactory()
+        product.create()
+        likes.add(product.id, 2)
+        expected = product.serialize()
+        expected["like"] += 2
+        self.assertEqual(product_dict(product), marshal(expected, product_model))
+        response = self.client.get(f"{BASE_URL}/{product.id}")
+        self.assertEqual(response.get_json(), marshal(expected, product_model))
+
+    def test_swagger_models(self):
+        """It should still document the Product models in Swagger"""
+        response = self.client.get("/api/swagger.json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        spec = response.get_json()
+        self.assertIn("ProductModel", spec["definitions"])
+        get = spec["paths"]["/products/{product_id}"]["get"]
+        self.assertEqual(get["responses"]["200"]["schema"]["$ref"], "#/definitions/ProductModel")
+        post = spec["paths"]["/products"]["post"]
+        self.assertEqual(post["responses"]["201"]["schema"]["$ref"], "#/definitions/ProductModel")
+
+    def test_get_product_fields(self):
+        """It should Get only the requested fields of a Product"""
+        product = ProductFactory()
+        product.create()
+        likes.add(product.id, 3)
+        for _ in range(2):  # read from the database, then from the cache
+            response = self.client.get(f"{BASE_URL}/{product.id}", query_string="fields=name,like,id")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                response.get_json(), {"name": product.name, "like": product.like + 3, "id": str(product.id)}
+            )
+            Product.find(product.id)
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            f"{BASE_URL}/{product.id}", query_string="fields=name,like,id", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(f"{BASE_URL}/0", query_string="fields=name")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_product_list_fields(self):
+        """It should List only the requested fields of Products"""
+        products = self._create_products(5)
+        response = self.client.get(BASE_URL, query_string="fields=inventory,price&sort=-price&limit=3")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 3)
+        self.assertEqual(set(data[0]), {"inventory", "price"})
+        prices = sorted((product.price for product in products), reverse=True)
+        self.assertEqual([item["price"] for item in data], prices[:3])
+        # the cursor still pages through the projected rows
+        response = self.client.get(response.headers["Link"].split(">")[0].lstrip("<"))
+        self.assertEqual([item["price"] for item in response.get_json()], prices[3:])
+        response = self.client.get(BASE_URL, query_string="fields=created_date,modified_date,disable,available,category")
+        self.assertEqual(len(response.get_json()), 5)
+        self.assertEqual(
+            list(response.get_json()[0]), ["created_date", "modified_date", "disable", "available", "category"]
+        )
+
+    def test_stream_product_list_fields(self):
+        """It should stream only the requested fields of Products"""
+        self._create_products(3)
+        response = self.client.get(BASE_URL, query_string="stream=true&fields=id")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(list(json.loads(lines[0])), ["id"])
+
+    def test_get_product_bad_fields(self):
+        """It should not Get fields a Product does not have"""
+        response = self.client.get(BASE_URL, query_string="fields=name,password")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("password", response.get_json()["message"])
+        response = self.client.get(BASE_URL, query_string="fields=,")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_get_product_not_found(self):
         """It should not Get a Product thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -193,6 +539,81 @@ class TestYourResourceServer(TestCase):
         logging.debug("Response data = %s", data)
         self.assertIn("was not found", data["message"])
 
+    def test_search_products(self):
+        """It should Search Products by the start of words in their name and category"""
+        products = ProductFactory.build_batch(3, name="Kale", category="vegetable")
+        products.append(ProductFactory.build(name="Coke", category="beverage"))
+        Product.bulk_create(products)
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=KAL veg")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([item["id"] for item in data], [str(product.id) for product in products[:3]])
+        self.assertIn("ETag", response.headers)
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=kale coke")
+        self.assertEqual(response.get_json(), [])
+
+    def test_search_products_paged(self):
+        """It should page through the results of a search"""
+        products = ProductFactory.build_batch(5, name="Milk", category="dairy")
+        Product.bulk_create(products)
+        seen = []
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=milk&limit=2")
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(int(item["id"]) for item in response.get_json())
+            link = response.headers.get("Link")
+            if not link:
+                break
+            next_url = link[link.index("<") + 1:link.index(">")]
+            self.assertIn("/api/products/search?q=milk", next_url)
+            response = self.client.get(next_url)
+        self.assertEqual(seen, [product.id for product in products])
+
+    def test_search_products_bad_request(self):
+        """It should not Search without words or with a bad cursor"""
+        response = self.client.get(f"{BASE_URL}/search")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=%20%21")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=milk&cursor=nope")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_suggest_products(self):
+        """It should Suggest Product names by prefix, most liked first"""
+        Product.bulk_create(
+            [
+                ProductFactory.build(name="Kale", like=1),
+                ProductFactory.build(name="Kale Chips", like=5),
+                ProductFactory.build(name="Coke", like=9),
+            ]
+        )
+        response = self.client.get(f"{BASE_URL}/suggest", query_string="prefix=ka")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.get_json(),
+            [{"name": "Kale Chips", "like": 5, "count": 1}, {"name": "Kale", "like": 1, "count": 1}],
+        )
+        response = self.client.get(f"{BASE_URL}/suggest", query_string="prefix=ka&limit=1")
+        self.assertEqual([item["name"] for item in response.get_json()], ["Kale Chips"])
+
+    def test_suggest_products_counts_likes(self):
+        """It should rank a name up as soon as it is liked"""
+        products = [ProductFactory.build(name="Kale", like=1), ProductFactory.build(name="Kiwi", like=2)]
+        Product.bulk_create(products)
+        Product.suggest("k")  # built before the likes, which are not in the database yet
+        for _ in range(2):
+            response = self.client.put(f"{BASE_URL}/{products[0].id}/like")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/suggest", query_string="prefix=k")
+        self.assertEqual([item["name"] for item in response.get_json()], ["Kale", "Kiwi"])
+
+    def test_suggest_products_bad_request(self):
+        """It should not Suggest without a prefix or with a bad limit"""
+        response = self.client.get(f"{BASE_URL}/suggest")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/suggest", query_string="prefix=k&limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_product(self):
         """It should Create a new Product"""
         test_product = ProductFactory()
@@ -232,6 +653,64 @@ class TestYourResourceServer(TestCase):
             date.fromisoformat(new_product["modified_date"]), test_product.modified_date
         )
 
+    def test_create_product_batch(self):
+        """It should Create a batch of Products in one request"""
+        batch = [product.serialize() for product in ProductFactory.build_batch(5)]
+        response = self.client.post(f"{BASE_URL}/batch", json=batch)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.get_json()
+        self.assertEqual([result["index"] for result in results], list(range(5)))
+        for item, result in zip(batch, results):
+            self.assertEqual(result["status"], status.HTTP_201_CREATED)
+            data = self.client.get(f"{BASE_URL}/{result['id']}").get_json()
+            self.assertEqual(data["name"], item["name"])
+
+    def test_create_product_batch_atomic(self):
+        """It should not Create any of an atomic batch with a bad item"""
+        batch = [product.serialize() for product in ProductFactory.build_batch(3)]
+        del batch[1]["name"]
+        response = self.client.post(f"{BASE_URL}/batch", json=batch)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        results = response.get_json()
+        self.assertIn("missing name", results[1]["error"])
+        self.assertIn("batch was rejected", results[0]["error"])
+        self.assertEqual(self.client.get(BASE_URL).get_json(), [])
+
+    def test_create_product_batch_independent(self):
+        """It should Create the good items of a non-atomic batch"""
+        batch = [product.serialize() for product in ProductFactory.build_batch(4)]
+        del batch[1]["name"]
+        batch[2]["price"] = None  # rejected by the database, not deserialize
+        response = self.client.post(f"{BASE_URL}/batch?atomic=false", json=batch)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.get_json()
+        self.assertEqual(
+            [result["status"] for result in results],
+            [201, 400, 400, 201],
+        )
+        self.assertIn("rejected by the database", results[2]["error"])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 2)
+
+    def test_create_product_batch_bad_date(self):
+        """It should reject an item with a bad date on its own"""
+        batch = [product.serialize() for product in ProductFactory.build_batch(3)]
+        batch[1]["created_date"] = "2023-13-01"
+        response = self.client.post(f"{BASE_URL}/batch?atomic=false", json=batch)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.get_json()
+        self.assertEqual([result["status"] for result in results], [201, 400, 201])
+        self.assertIn("bad date", results[1]["error"])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 2)
+
+    def test_create_product_batch_bad_request(self):
+        """It should not Create a batch that is not a list or is too big"""
+        response = self.client.post(f"{BASE_URL}/batch", json={"name": "Coke"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        batch = [product.serialize() for product in ProductFactory.build_batch(3)]
+        with patch.dict(app.config, {"BATCH_MAX_ITEMS": 2}):
+            response = self.client.post(f"{BASE_URL}/batch", json=batch)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
     def test_update_product(self):
         """It should Update an existing Product"""
         # create a product to update
@@ -306,6 +785,35 @@ class TestYourResourceServer(TestCase):
         response = self.client.put(f"{BASE_URL}/-1/purchase")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_purchase_a_quantity(self):
+        """It should Purchase several units of a Product at once"""
+        test_product = ProductFactory(inventory=5, available=True)
+        response = self.client.post(BASE_URL, json=test_product.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        product_id = response.get_json()["id"]
+
+        response = self.client.put(f"{BASE_URL}/{product_id}/purchase?quantity=3")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["inventory"], 2)
+        self.assertEqual(data["available"], True)
+
+        response = self.client.put(f"{BASE_URL}/{product_id}/purchase?quantity=3")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn("has only 2 in inventory", response.get_json()["message"])
+
+        response = self.client.put(f"{BASE_URL}/{product_id}/purchase?quantity=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["inventory"], 0)
+        self.assertEqual(data["available"], False)
+
+    def test_purchase_bad_quantity(self):
+        """It should not Purchase a Product with a bad quantity"""
+        test_product = self._create_products(1)[0]
+        response = self.client.put(f"{BASE_URL}/{test_product.id}/purchase?quantity=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_adjust_inventory(self):
         """It should adjust the inventory of a product"""
         test_product = ProductFactory()
@@ -327,6 +835,111 @@ class TestYourResourceServer(TestCase):
         logging.debug("Response data: %s", data)
         self.assertEqual(data["available"], False)
 
+    def test_writes_skip_cache(self):
+        """It should not write back cached values that another worker changed"""
+        product = ProductFactory(inventory=10, available=True)
+        product.create()
+        response = self.client.get(f"{BASE_URL}/{product.id}")  # now it is cached
+        self.assertEqual(response.get_json()["inventory"], 10)
+        with db.engine.begin() as connection:  # another worker restocks
+            connection.execute(Product.__table__.update().values(inventory=15))
+        response = self.client.put(f"{BASE_URL}/{product.id}/adjust_inventory", json={"inventory_change": 5})
+        self.assertEqual(response.get_json()["inventory"], 20)
+        response = self.client.get(f"{BASE_URL}/{product.id}")  # cached again
+        with db.engine.begin() as connection:  # another worker deletes it
+            connection.execute(Product.__table__.delete())
+        response = self.client.put(f"{BASE_URL}/{product.id}", json=product.serialize())
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(f"{BASE_URL}/{product.id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_adjust_inventory_batch(self):
+        """It should adjust the inventory of many products at once"""
+        products = self._create_products(3)
+        for product in products:
+            product.inventory = 10
+            product.available = True
+            self.client.put(f"{BASE_URL}/{product.id}", json=product.serialize())
+        changes = [
+            {"id": int(products[0].id), "inventory_change": 5},
+            {"id": int(products[1].id), "inventory_change": -15},
+            {"id": int(products[0].id), "inventory_change": -2},
+        ]
+        response = self.client.put(f"{BASE_URL}/adjust_inventory", json=changes)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = {product["id"]: product for product in response.get_json()}
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[int(products[0].id)]["inventory"], 13)
+        self.assertEqual(data[int(products[0].id)]["available"], True)
+        self.assertEqual(data[int(products[1].id)]["inventory"], 0)
+        self.assertEqual(data[int(products[1].id)]["available"], False)
+        data = self.client.get(f"{BASE_URL}/{products[2].id}").get_json()
+        self.assertEqual(data["inventory"], 10)
+
+    def test_adjust_inventory_batch_not_found(self):
+        """It should not adjust any inventory if a product is not found"""
+        product = self._create_products(1)[0]
+        changes = [
+            {"id": int(product.id), "inventory_change": 5},
+            {"id": 0, "inventory_change": 1},
+        ]
+        response = self.client.put(f"{BASE_URL}/adjust_inventory", json=changes)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("[0] were not found", response.get_json()["message"])
+        data = self.client.get(f"{BASE_URL}/{product.id}").get_json()
+        self.assertEqual(data["inventory"], product.inventory)
+
+    def test_adjust_inventory_batch_bad_data(self):
+        """It should not adjust inventory from bad data"""
+        url = f"{BASE_URL}/adjust_inventory"
+        response = self.client.put(url, json={"id": 1, "inventory_change": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(url, json=[{"id": 1}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("are required", response.get_json()["message"])
+        response = self.client.put(url, json=[{"id": 1, "inventory_change": True}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("must be integers", response.get_json()["message"])
+        response = self.client.put(url, json=[])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), [])
+        with patch.dict(app.config, {"BATCH_MAX_ITEMS": 2}):
+            response = self.client.put(url, json=[{"id": 1, "inventory_change": 1}] * 3)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_adjust_inventory_overflow(self):
+        """It should not adjust inventory past the largest value of the column"""
+        product = self._create_products(1)[0]
+        response = self.client.put(f"{BASE_URL}/{product.id}/adjust_inventory", json={"inventory_change": 2**40})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(
+            f"{BASE_URL}/{product.id}/adjust_inventory", json={"inventory_change": INVENTORY_MAX}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        url = f"{BASE_URL}/adjust_inventory"
+        response = self.client.put(url, json=[{"id": int(product.id), "inventory_change": -(2**40)}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(url, json=[{"id": int(product.id), "inventory_change": INVENTORY_MAX}] * 2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Item 1", response.get_json()["message"])
+        response = self.client.put(url, json=[{"id": int(product.id), "inventory_change": INVENTORY_MAX}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data = self.client.get(f"{BASE_URL}/{product.id}").get_json()
+        self.assertEqual(data["inventory"], product.inventory)
+
+    def test_update_product_with_buffered_likes(self):
+        """It should not count buffered likes twice when a Product is updated"""
+        product = ProductFactory(like=10)
+        product.create()
+        likes.add(product.id, 3)
+        data = self.client.get(f"{BASE_URL}/{product.id}").get_json()
+        self.assertEqual(data["like"], 13)
+        response = self.client.put(f"{BASE_URL}/{product.id}", json=data)
+        self.assertEqual(response.get_json()["like"], 13)
+        likes.flush()
+        db.session.expire_all()
+        self.assertEqual(Product.find(product.id, cached=False).like, 13)
+
     def test_like_product(self):
         """It should like a product that is found"""
         test_product = self._create_products(1)[0]
@@ -339,6 +952,23 @@ class TestYourResourceServer(TestCase):
         data = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
         self.assertEqual(data["like"], like_cnt + 1)
 
+    def test_like_product_write_behind(self):
+        """It should show buffered likes until they are flushed"""
+        test_product = self._create_products(1)[0]
+        for _ in range(3):
+            response = self.client.put(f"{BASE_URL}/{test_product.id}/like")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["like"], test_product.like + 3)
+        data = self.client.get(BASE_URL).get_json()
+        self.assertEqual(data[0]["like"], test_product.like + 3)
+
+        likes.flush()
+        self.assertEqual(likes.pending(int(test_product.id)), 0)
+        db.session.expire_all()
+        self.assertEqual(Product.find(test_product.id).like, test_product.like + 3)
+        data = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
+        self.assertEqual(data["like"], test_product.like + 3)
+
     def test_disable_product(self):
         """It should disable the fetched product"""
         # create a product to disable
@@ -375,6 +1005,13 @@ class TestYourResourceServer(TestCase):
         updated_product = response.get_json()
         self.assertEqual(updated_product["disable"], False)
         self.assertEqual(updated_product["available"], True)
+        # the buffered likes are included, as in every single Product response
+        likes.add(int(new_product["id"]), 2)
+        for action in ("enable", "disable"):
+            response = self.client.put(f"{BASE_URL}/{new_product['id']}/{action}")
+            self.assertEqual(response.get_json()["like"], new_product["like"] + 2)
+        response = self.client.put(f"{BASE_URL}/{new_product['id']}/adjust_inventory", json={"inventory_change": 1})
+        self.assertEqual(response.get_json()["like"], new_product["like"] + 2)
 
     ######################################################################
     #  T E S T   S A D   P A T H S
@@ -502,3 +1139,124 @@ class TestYourResourceServer(TestCase):
     #     test_product["inventory"] = "male"    # wrong case
     #     response = self.client.post(BASE_URL, json=test_product)
     #     self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+######################################################################
+#  C O M P R E S S I O N   T E S T   C A S E S
+######################################################################
+class TestCompressedResponses(TestCase):
+    """Test Cases for compressed responses"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        db.session.query(Product).delete()  # clean up the last tests
+        db.session.commit()
+        likes.clear()
+        Product.bulk_create(ProductFactory.build_batch(30))
+
+    def tearDown(self):
+        db.session.remove()
+
+    def test_list_gzip(self):
+        """It should gzip a large list for a client that accepts it"""
+        plain = self.client.get(BASE_URL)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertEqual(json.loads(gzip.decompress(response.data)), plain.get_json())
+        # the compressed bytes differ per coding, so the ETag is weak
+        self.assertEqual(response.headers["ETag"], "W/" + plain.headers["ETag"])
+        response = self.client.get(
+            BASE_URL,
+            headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(response.headers["ETag"].startswith("W/"))
+
+    def test_best_coding(self):
+        """It should pick the coding the client prefers among those it has"""
+        for encoding in available_encodings(["br", "zstd"]):
+            response = self.client.get(BASE_URL, headers={"Accept-Encoding": f"gzip;q=0.5, {encoding}"})
+            self.assertEqual(response.headers["Content-Encoding"], encoding)
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip;q=0, identity"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_small_response(self):
+        """It should not compress a response below the size threshold"""
+        product = Product.all()[0]
+        response = self.client.get(f"{BASE_URL}/{product.id}", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_json()["id"], str(product.id))
+
+    def test_stream_gzip(self):
+        """It should gzip a streamed list chunk by chunk"""
+        with patch.dict(app.config, {"STREAM_BATCH_SIZE": 7}):
+            response = self.client.get(
+                BASE_URL, query_string="stream=true", headers={"Accept-Encoding": "gzip"}
+            )
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        lines = gzip.decompress(response.data).decode().splitlines()
+        self.assertEqual(len(lines), 30)
+        self.assertIn("name", json.loads(lines[0]))
+
+
+class TestPrecompressedStatic(TestCase):
+    """Test Cases for precompressed static files"""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.folder = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.source = os.path.join(self.folder.name, "site.css")
+        with open(self.source, "w", encoding="utf-8") as file:
+            file.write("body { color: red; }\n" * 500)
+        with open(os.path.join(self.folder.name, "tiny.css"), "w", encoding="utf-8") as file:
+            file.write("p {}\n")
+        self.static_folder = app.static_folder
+        app.static_folder = self.folder.name
+
+    def tearDown(self):
+        app.static_folder = self.static_folder
+        self.folder.cleanup()
+
+    def test_static_compress(self):
+        """It should serve a static file from its precompressed copy"""
+        result = app.test_cli_runner().invoke(args=["static-compress"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("site.css", result.output)
+        self.assertNotIn("tiny.css", result.output)
+        self.assertTrue(os.path.isfile(self.source + ".gz"))
+        result = app.test_cli_runner().invoke(args=["static-compress"])
+        self.assertIn("Wrote 0 compressed files", result.output)
+
+        response = self.client.get("/static/site.css", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.mimetype, "text/css")
+        with open(self.source, "rb") as file:
+            self.assertEqual(gzip.decompress(response.data), file.read())
+        response.close()
+
+        response = self.client.get("/static/site.css")
+        self.assertNotIn("Content-Encoding", response.headers)
+        response.close()
+
+    def test_stale_copy(self):
+        """It should not serve a precompressed copy older than its file"""
+        with open(self.source + ".gz", "wb") as file:
+            file.write(gzip.compress(b"stale"))
+        os.utime(self.source + ".gz", (0, 0))
+        response = self.client.get("/static/site.css", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertIn(b"color: red", response.data)
+        response.close()
+        response = self.client.get("/static/missing.css", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,260 @@
+"""
+Test cases for the ASGI mode of the Product Service
+
+The coroutine views must answer exactly as the Flask views they stand
+in for, so most tests make the same request both ways and compare.
+"""
+import json
+import logging
+import threading
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+from service import app as flask_app
+from service.asgi import app, async_url, database
+from service.common import status
+from service.common.replica import router
+from service.common.like_buffer import likes
+from service.models import db, Product
+from tests.factories import ProductFactory
+
+BASE_URL = "/api/products"
+# headers that legitimately differ between two answers to the same request
+TIMING_HEADERS = {"server-timing"}
+
+
+async def call(path, query="", method="GET", headers=None, body=b""):
+    """Sends one request to the ASGI app and returns its status, headers and body"""
+    headers = dict(headers or {})
+    if body:
+        headers["content-length"] = str(len(body))
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+        "http_version": "1.1",
+        "scheme": "http",
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 50000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    response_headers = {key.decode(): value.decode() for key, value in start["headers"]}
+    return start["status"], response_headers, b"".join(message.get("body", b"") for message in sent[1:])
+
+
+######################################################################
+#  A S G I   T E S T   C A S E S
+######################################################################
+# pylint: disable=too-many-public-methods
+class TestAsyncRoutes(IsolatedAsyncioTestCase):
+    """Test Cases for the coroutine views of service.asgi"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        flask_app.config["TESTING"] = True
+        flask_app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = flask_app.test_client()
+        db.session.query(Product).delete()  # clean up the last tests
+        db.session.commit()
+        likes.clear()
+        Product.cache.clear()
+        self.ids = Product.bulk_create(ProductFactory.build_batch(5))
+
+    async def asyncTearDown(self):
+        # each test has an event loop of its own, and the pool is bound to it
+        await database.dispose()
+
+    def tearDown(self):
+        db.session.remove()
+
+    async def assert_same(self, path, query="", headers=None):
+        """Checks that the ASGI app answers a request as Flask does"""
+        code, response_headers, body = await call(path, query, headers=headers)
+        expected = self.client.get(f"{path}?{query}", headers=headers)
+        self.assertEqual(code, expected.status_code)
+        self.assertEqual(body, expected.data)
+        for key, value in expected.headers.items():
+            if key.lower() not in TIMING_HEADERS:
+                self.assertEqual(response_headers[key.lower()], value, key)
+        return code, response_headers, body
+
+    async def test_get_product(self):
+        """It should read a Product on the async engine as Flask does"""
+        code, headers, body = await self.assert_same(f"{BASE_URL}/{self.ids[0]}")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(body)["id"], str(self.ids[0]))
+        self.assertIn('desc="1 statements"', headers["server-timing"])
+
+    async def test_get_product_cached(self):
+        """It should share the Product cache with the Flask views"""
+        await call(f"{BASE_URL}/{self.ids[0]}")
+        self.assertIsNotNone(Product.cache.get(self.ids[0]))
+        _, headers, _ = await self.assert_same(f"{BASE_URL}/{self.ids[0]}")
+        self.assertIn('desc="0 statements"', headers["server-timing"])
+
+    async def test_skip_replica_probe(self):
+        """It should not probe the replica on the event loop for coroutine views"""
+        with patch.object(router, "check", return_value=False) as check:
+            code, _, _ = await call(f"{BASE_URL}/{self.ids[0]}")
+            self.assertEqual(code, status.HTTP_200_OK)
+            await call(BASE_URL)
+            check.assert_not_called()
+            await call("/health")  # Flask views still route their reads
+            check.assert_called_once()
+
+    async def test_get_product_fields(self):
+        """It should read only the fields asked for"""
+        await self.assert_same(f"{BASE_URL}/{self.ids[1]}", "fields=name,like")
+        Product.cache.clear()
+        await self.assert_same(f"{BASE_URL}/{self.ids[1]}", "fields=price")
+
+    async def test_get_product_not_modified(self):
+        """It should answer If-None-Match with a 304"""
+        _, headers, _ = await call(f"{BASE_URL}/{self.ids[0]}")
+        code, _, body = await self.assert_same(f"{BASE_URL}/{self.ids[0]}", headers={"If-None-Match": headers["etag"]})
+        self.assertEqual(code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(body, b"")
+
+    async def test_get_product_not_found(self):
+        """It should not find a Product that does not exist"""
+        code, _, _ = await self.assert_same(f"{BASE_URL}/0")
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+        code, _, _ = await call(f"{BASE_URL}/not-an-id")
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+
+    async def test_list_products(self):
+        """It should list and filter Products as Flask does"""
+        code, _, body = await self.assert_same(BASE_URL)
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(body)), 5)
+        product = Product.find(self.ids[2])
+        await self.assert_same(BASE_URL, f"category={product.category}&available={str(product.available).lower()}")
+        await self.assert_same(BASE_URL, "fields=id,like&sort=-price")
+        await self.assert_same(BASE_URL, "fields=id")
+
+    async def test_list_pages(self):
+        """It should follow the next links through every page"""
+        query = "limit=2&sort=price"
+        seen = []
+        while query:
+            _, headers, body = await self.assert_same(BASE_URL, query)
+            seen.extend(item["id"] for item in json.loads(body))
+            link = headers.get("link")
+            query = link[link.index("?") + 1:link.index(">")] if link else None
+        self.assertEqual(sorted(seen), sorted(str(product_id) for product_id in self.ids))
+
+    async def test_list_bad_request(self):
+        """It should reject a bad sort or cursor as Flask does"""
+        code, _, _ = await self.assert_same(BASE_URL, "sort=nope")
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+        code, _, _ = await self.assert_same(BASE_URL, "cursor=garbage")
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_list_compressed(self):
+        """It should compress through the same after_request hooks"""
+        Product.bulk_create(ProductFactory.build_batch(50))
+        _, headers, _ = await self.assert_same(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(headers["content-encoding"], "gzip")
+
+    async def test_stream_goes_to_flask(self):
+        """It should hand the NDJSON stream to Flask"""
+        code, headers, body = await call(BASE_URL, "stream=true")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(headers["content-type"], "application/x-ndjson")
+        self.assertEqual(len(body.splitlines()), 5)
+
+    async def test_writes_go_to_flask(self):
+        """It should hand everything but the reads to Flask"""
+        item = ProductFactory().serialize()
+        body = json.dumps(item).encode()
+        code, _, body = await call(BASE_URL, method="POST", headers={"Content-Type": "application/json"}, body=body)
+        self.assertEqual(code, status.HTTP_201_CREATED)
+        new_id = json.loads(body)["id"]
+        code, _, _ = await call(f"{BASE_URL}/{new_id}/like", method="PUT")
+        self.assertEqual(code, status.HTTP_200_OK)
+        code, _, _ = await call("/health")
+        self.assertEqual(code, status.HTTP_200_OK)
+
+    async def test_response_built_off_the_loop(self):
+        """It should build and compress the response of a coroutine view on a pool thread"""
+        threads = []
+        finalize = flask_app.finalize_request
+
+        def record(response):
+            threads.append(threading.current_thread().name)
+            return finalize(response)
+
+        with patch.object(flask_app, "finalize_request", side_effect=record):
+            code, _, _ = await call(f"{BASE_URL}/{self.ids[0]}")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("wsgi"))
+
+    async def test_stream_through_flask(self):
+        """It should send a streamed response from Flask chunk by chunk"""
+        code, headers, body = await call(BASE_URL, "stream=true")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(headers["content-type"], "application/x-ndjson")
+        self.assertEqual(len(body.splitlines()), 5)
+
+    async def test_disconnect_before_body(self):
+        """It should not run Flask for a client that went away"""
+        sent = []
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": BASE_URL, "query_string": b"", "http_version": "1.1"}
+        await app(scope, receive, send)
+        self.assertEqual(sent, [])
+
+    async def test_lifespan(self):
+        """It should close the async engine when the worker shuts down"""
+        await call(f"{BASE_URL}/{self.ids[0]}")
+        self.assertIsNotNone(database.engine)
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await app({"type": "lifespan"}, receive, send)
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        self.assertIsNone(database.engine)
+
+    async def test_unsupported_scope(self):
+        """It should refuse a websocket"""
+        with self.assertRaises(ValueError):
+            await app({"type": "websocket"}, None, None)
+
+
+class TestAsyncUrl(TestCase):
+    """Test Cases for picking the async driver"""
+
+    def test_async_url(self):
+        """It should swap in the async driver of each database"""
+        self.assertEqual(async_url("postgresql://u:p@db/x").drivername, "postgresql+psycopg")
+        self.assertEqual(async_url("postgresql+psycopg://u:p@db/x").drivername, "postgresql+psycopg")
+        self.assertEqual(async_url("sqlite:////tmp/x.db").drivername, "sqlite+aiosqlite")
+        self.assertEqual(async_url("mysql+aiomysql://u:p@db/x").drivername, "mysql+aiomysql")
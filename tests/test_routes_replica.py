@@ -0,0 +1,132 @@
+"""
+Test cases for reading from a replica
+
+The replica is a second database, a SQLite file unless
+DATABASE_REPLICA_URI names another one. Products that only exist in
+one of the two databases show which one served a request.
+"""
+import os
+import logging
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+from sqlalchemy.orm import Session
+from service import app
+from service.common import status
+from service.common.like_buffer import likes
+from service.common.replica import router
+from service.models import db, Product
+from tests.factories import ProductFactory
+
+BASE_URL = "/api/products"
+REPLICA_ONLY_ID = 987654
+
+
+######################################################################
+#  R E P L I C A   T E S T   C A S E S
+######################################################################
+class TestReplicaRouting(TestCase):
+    """Test Cases for routing reads to the replica"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+        cls.replica_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        cls.replica_uri = os.getenv("DATABASE_REPLICA_URI", f"sqlite:///{cls.replica_dir.name}/replica.db")
+
+    @classmethod
+    def tearDownClass(cls):
+        """Run once after all tests"""
+        router.dispose()
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        likes.clear()
+        db.session.query(Product).delete()  # clean up the last tests
+        db.session.commit()
+        Product.cache.clear()
+        self.configure(self.replica_uri)
+        db.metadata.create_all(router.engine)
+        with Session(router.engine) as session:
+            session.query(Product).delete()
+            session.add(ProductFactory.build(id=REPLICA_ONLY_ID, name="Replica"))
+            session.commit()
+
+    def tearDown(self):
+        """Runs after each test"""
+        db.session.remove()
+        router.dispose()
+
+    @staticmethod
+    def configure(uri, **settings):
+        """Points the router at a replica"""
+        router.configure(uri, **{"sticky_seconds": 5, "check_interval": 60, "max_lag": 10, **settings})
+
+    def test_reads_from_replica(self):
+        """It should serve GET requests from the replica"""
+        resp = self.client.get(f"{BASE_URL}/{REPLICA_ONLY_ID}")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["name"], "Replica")
+        resp = self.client.get(BASE_URL)
+        self.assertEqual([item["id"] for item in resp.get_json()], [str(REPLICA_ONLY_ID)])
+        self.assertTrue(self.client.get("/health").get_json()["replica"]["healthy"])
+
+    def test_writes_go_to_primary(self):
+        """It should write to the primary and pin the writer to it"""
+        resp = self.client.post(BASE_URL, json=ProductFactory().serialize())
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        new_id = resp.get_json()["id"]
+        self.assertIn("read_primary=1", resp.headers["Set-Cookie"])
+        self.assertIn("Max-Age=5", resp.headers["Set-Cookie"])
+        # another client reads from the replica, which does not have it yet
+        other = app.test_client()
+        self.assertEqual(other.get(f"{BASE_URL}/{new_id}").status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(other.get(f"{BASE_URL}/{REPLICA_ONLY_ID}").status_code, status.HTTP_200_OK)
+        # while the writer reads its own writes from the primary
+        self.assertEqual(self.client.get(f"{BASE_URL}/{new_id}").status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(f"{BASE_URL}/{REPLICA_ONLY_ID}").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_failed_write_not_sticky(self):
+        """It should not pin a client whose write was rejected"""
+        resp = self.client.post(BASE_URL, json={"name": "no price"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn("Set-Cookie", resp.headers)
+        self.assertEqual(self.client.get(f"{BASE_URL}/{REPLICA_ONLY_ID}").status_code, status.HTTP_200_OK)
+
+    def test_unreachable_replica(self):
+        """It should read from the primary while the replica is down"""
+        self.configure(f"sqlite:///{self.replica_dir.name}/missing/replica.db")
+        product = ProductFactory()
+        product.create()
+        resp = self.client.get(f"{BASE_URL}/{product.id}")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        health = self.client.get("/health").get_json()["replica"]
+        self.assertEqual(health, {"enabled": True, "healthy": False, "lag_seconds": None, "sticky_seconds": 5})
+
+    def test_lagging_replica(self):
+        """It should read from the primary while the replica lags behind"""
+        self.configure(self.replica_uri, max_lag=-1)
+        self.assertFalse(router.check())
+        self.assertEqual(router.lag, 0)
+        self.assertEqual(self.client.get(f"{BASE_URL}/{REPLICA_ONLY_ID}").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_check_interval(self):
+        """It should probe the replica again only once the interval is up"""
+        self.assertTrue(router.check())
+        router.on_error(SimpleNamespace(is_disconnect=True, connection=object(), original_exception="gone"))
+        self.assertFalse(router.check())
+        router.check_interval = 0
+        self.assertTrue(router.check())
+
+    def test_no_replica(self):
+        """It should read from the primary when no replica is configured"""
+        router.dispose()
+        self.assertFalse(router.check())
+        self.assertEqual(router.stats(), {"enabled": False})
+        self.assertEqual(self.client.get(f"{BASE_URL}/{REPLICA_ONLY_ID}").status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.client.post(BASE_URL, json=ProductFactory().serialize())
+        self.assertNotIn("Set-Cookie", resp.headers)
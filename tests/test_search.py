@@ -0,0 +1,97 @@
+"""
+Test cases for the in-process Search Index
+"""
+from unittest import TestCase
+from service.common.search import SearchIndex, tokenize
+
+
+######################################################################
+#  S E A R C H   I N D E X   T E S T   C A S E S
+######################################################################
+class TestSearchIndex(TestCase):
+    """Test Cases for the Search Index"""
+
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.build(
+            lambda: [
+                (1, "Coke", "beverage"),
+                (2, "Coconut Milk", "dairy"),
+                (3, "Milk", "dairy"),
+                (4, None, "beverage"),
+            ]
+        )
+
+    def test_tokenize(self):
+        """It should split text into distinct lower case words"""
+        self.assertEqual(tokenize("Coke, coke ZERO-sugar!"), ["coke", "zero", "sugar"])
+        self.assertEqual(tokenize(None), [])
+        self.assertEqual(tokenize(" ,; "), [])
+
+    def test_search_prefix(self):
+        """It should match words by their start, whole words first"""
+        self.assertTrue(self.index.ready)
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.search(["coke"]), [1])
+        self.assertEqual(self.index.search(["co"]), [1, 2])
+        self.assertEqual(self.index.search(["milk"]), [2, 3])
+        self.assertEqual(self.index.search(["bev"]), [1, 4])
+        self.assertEqual(self.index.search(["tea"]), [])
+        self.assertEqual(self.index.search([]), [])
+
+    def test_search_every_word(self):
+        """It should only return documents that match every word"""
+        self.assertEqual(self.index.search(["milk", "dairy"]), [2, 3])
+        self.assertEqual(self.index.search(["co", "dairy"]), [2])
+        self.assertEqual(self.index.search(["coke", "dairy"]), [])
+        self.assertEqual(self.index.search(["nothing", "dairy"]), [])
+
+    def test_search_ranking(self):
+        """It should rank whole word matches above prefix matches"""
+        self.index.add(5, "Cola", "beverage")
+        self.assertEqual(self.index.search(["cola"]), [5])
+        self.assertEqual(self.index.search(["col", "beverage"]), [5])
+        self.assertEqual(self.index.search(["coke", "bev"]), [1])
+        self.assertEqual(self.index.search(["co", "beverage"]), [1, 5])
+        self.assertEqual(self.index.search(["co"], limit=2), [1, 2])
+
+    def test_add_and_remove(self):
+        """It should follow documents as they are added, changed and removed"""
+        self.index.add(5, "Kale", "vegetable")
+        self.assertEqual(self.index.search(["kale"]), [5])
+        self.index.add(1, "Pepsi", "beverage")
+        self.assertEqual(self.index.search(["coke"]), [])
+        self.assertEqual(self.index.search(["pepsi"]), [1])
+        self.index.remove(1, 5, 99)
+        self.assertEqual(self.index.search(["pepsi"]), [])
+        self.assertEqual(self.index.search(["kale"]), [])
+        self.assertEqual(self.index.search(["bev"]), [4])
+        self.assertEqual(len(self.index), 3)
+
+    def test_not_built(self):
+        """It should not keep documents before it has been built"""
+        index = SearchIndex()
+        index.add(1, "Coke", "beverage")
+        self.assertFalse(index.ready)
+        self.assertEqual(len(index), 0)
+
+    def test_invalidate(self):
+        """It should be rebuilt after writes that it could not follow"""
+        self.index.invalidate()
+        self.assertFalse(self.index.ready)
+        self.index.add(5, "Kale", "vegetable")
+        self.assertEqual(self.index.search(["kale"]), [])
+        self.index.build(lambda: [(5, "Kale", "vegetable")])
+        self.assertTrue(self.index.ready)
+        self.assertEqual(self.index.search(["kale"]), [5])
+
+    def test_write_during_build(self):
+        """It should stay not ready when a write races with a build"""
+
+        def documents():
+            rows = [(1, "Coke", "beverage")]
+            self.index.add(2, "Milk", "dairy")
+            return rows
+
+        self.index.build(documents)
+        self.assertFalse(self.index.ready)
@@ -0,0 +1,28 @@
+"""
+Test cases for the JSON Serializer
+"""
+import json
+from unittest import TestCase, skipUnless
+from service.common import serializer
+from service.common.serializer import dumps
+
+DATA = [{"name": "shirt", "price": 6.5, "like": None, "available": True, "id": "1"}]
+
+
+######################################################################
+#  S E R I A L I Z E R   T E S T   C A S E S
+######################################################################
+class TestSerializer(TestCase):
+    """Test Cases for the JSON Serializer"""
+
+    def test_dumps_json(self):
+        """It should encode compact JSON bytes with the json module"""
+        body = dumps(DATA, encoder="json")
+        self.assertIsInstance(body, bytes)
+        self.assertNotIn(b" ", body.replace(b'"shirt"', b""))
+        self.assertEqual(json.loads(body), DATA)
+
+    @skipUnless(serializer.orjson, "orjson is not installed")
+    def test_dumps_orjson(self):
+        """It should encode the same JSON bytes with orjson"""
+        self.assertEqual(dumps(DATA), dumps(DATA, encoder="json"))
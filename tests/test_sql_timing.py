@@ -0,0 +1,73 @@
+"""
+Test cases for SQL Timing
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from service import app
+from service.common import sql_timing
+from service.models import db
+
+
+######################################################################
+#  S Q L   T I M I N G   T E S T   C A S E S
+######################################################################
+class TestSqlTiming(TestCase):
+    """Test Cases for SQL Timing"""
+
+    def tearDown(self):
+        db.session.remove()
+
+    def test_request_totals(self):
+        """It should add up the statements of a request and their time"""
+        with app.test_request_context("/"):
+            sql_timing.reset()
+            self.assertEqual(sql_timing.request_totals(), (0, 0.0))
+            db.session.execute(text("SELECT 1"))
+            db.session.execute(text("SELECT 2"))
+            count, seconds = sql_timing.request_totals()
+            self.assertEqual(count, 2)
+            self.assertGreater(seconds, 0)
+
+    def test_failed_statement(self):
+        """It should forget the start of a statement that failed"""
+        with app.test_request_context("/"):
+            sql_timing.reset()
+            self.assertRaises(DBAPIError, db.session.execute, text("SELECT * FROM no_such_table"))
+            db.session.rollback()
+            connection = db.session.connection()
+            self.assertEqual(connection.info.get("query_start", []), [])
+            self.assertEqual(sql_timing.request_totals()[0], 0)
+
+    def test_slow_query_log(self):
+        """It should log a slow statement with its parameters and route"""
+        with patch.dict(sql_timing.SLOW_QUERY, seconds=0.0, parameters=True):
+            with app.test_request_context("/api/products?name=slow"):
+                with self.assertLogs(sql_timing.slow_query_log, "WARNING") as logs:
+                    db.session.execute(text("SELECT :value"), {"value": "secret"})
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("GET /api/products", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+        self.assertIn("secret", logs.output[0])
+
+    def test_slow_query_hidden_parameters(self):
+        """It should leave out the parameters of a slow statement when asked"""
+        with patch.dict(sql_timing.SLOW_QUERY, seconds=0.0, parameters=False):
+            with self.assertLogs(sql_timing.slow_query_log, "WARNING") as logs:
+                db.session.execute(text("SELECT :value"), {"value": "secret"})
+        self.assertIn("background", logs.output[0])
+        self.assertNotIn("secret", logs.output[0])
+
+    def test_fast_query(self):
+        """It should not log statements under the threshold"""
+        with patch.dict(sql_timing.SLOW_QUERY, seconds=60.0):
+            with self.assertNoLogs(sql_timing.slow_query_log, "WARNING"):
+                db.session.execute(text("SELECT 1"))
+
+    def test_server_timing(self):
+        """It should format the Server-Timing header in milliseconds"""
+        self.assertEqual(
+            sql_timing.server_timing(3, 0.0015, 0.01),
+            'db;dur=1.50;desc="3 statements", app;dur=10.00',
+        )
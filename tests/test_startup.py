@@ -0,0 +1,29 @@
+"""
+Test cases for the Startup Timer
+"""
+import os
+from unittest import TestCase
+from service.common.startup import StartupTimer
+
+
+######################################################################
+#  S T A R T U P   T I M E R   T E S T   C A S E S
+######################################################################
+class TestStartupTimer(TestCase):
+    """Test Cases for the Startup Timer"""
+
+    def test_phases(self):
+        """It should time each phase and the time to ready"""
+        timer = StartupTimer()
+        with timer.phase("database"):
+            pass
+        with self.assertRaises(RuntimeError):
+            with timer.phase("broken"):
+                raise RuntimeError("failed")
+        self.assertIsNone(timer.summary()["ready_seconds"])
+        ready = timer.ready()
+        summary = timer.summary()
+        self.assertEqual(summary["pid"], os.getpid())
+        self.assertEqual(summary["ready_seconds"], ready)
+        self.assertEqual(list(summary["phases"]), ["database", "broken"])
+        self.assertGreaterEqual(ready, summary["phases"]["database"])
@@ -0,0 +1,115 @@
+"""
+Test cases for the Suggest Index
+"""
+from unittest import TestCase
+from sqlalchemy.exc import OperationalError
+from service.common.suggest import SuggestIndex
+
+
+######################################################################
+#  S U G G E S T   I N D E X   T E S T   C A S E S
+######################################################################
+class TestSuggestIndex(TestCase):
+    """Test Cases for the Suggest Index"""
+
+    def setUp(self):
+        self.index = SuggestIndex(limit=2)
+        self.index.build(
+            lambda: [
+                ("Coke", 5, 1),
+                ("coke", 4, 1),
+                ("Coconut Milk", 7, 1),
+                ("Cola", 1, 2),
+                ("Milk", None, 1),
+                (None, 3, 1),
+            ]
+        )
+
+    def test_suggest(self):
+        """It should return the best liked names that start with a prefix"""
+        self.assertTrue(self.index.ready)
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.suggest("co"), [("Coke", 9, 2), ("Coconut Milk", 7, 1)])
+        self.assertEqual(self.index.suggest("CO", limit=1), [("Coke", 9, 2)])
+        self.assertEqual(self.index.suggest("col"), [("Cola", 1, 2)])
+        self.assertEqual(self.index.suggest("milk"), [("Milk", 0, 1)])
+        self.assertEqual(self.index.suggest("tea"), [])
+        self.assertEqual(self.index.suggest(None), [])
+
+    def test_change_likes(self):
+        """It should rerank the cached prefixes as likes change"""
+        self.assertEqual(self.index.suggest("co")[0][0], "Coke")
+        self.index.change("Cola", likes=10)
+        self.assertEqual(self.index.suggest("co"), [("Cola", 11, 2), ("Coke", 9, 2)])
+        self.index.change("coconut milk", likes=5)
+        self.assertEqual(self.index.suggest("co"), [("Coconut Milk", 12, 1), ("Cola", 11, 2)])
+        self.index.change("Cola", likes=-11)
+        self.assertEqual(self.index.suggest("co"), [("Coconut Milk", 12, 1), ("Coke", 9, 2)])
+        self.index.change("Coke")
+        self.assertEqual(self.index.suggest("co"), [("Coconut Milk", 12, 1), ("Coke", 9, 2)])
+
+    def test_add_and_remove(self):
+        """It should follow names as Products are added, renamed and removed"""
+        self.assertEqual(self.index.suggest("ca"), [])
+        self.index.change("Carrot", likes=3, count=1)
+        self.assertEqual(self.index.suggest("ca"), [("Carrot", 3, 1)])
+        self.index.change("Coconut Milk", likes=-7, count=-1)
+        self.assertEqual(self.index.suggest("coc"), [])
+        self.index.rename("Carrot", 3, "Cabbage", 1)
+        self.assertEqual(self.index.suggest("ca"), [("Cabbage", 1, 1)])
+        self.index.rename("Cabbage", 1, "CABBAGE", 4)
+        self.assertEqual(self.index.suggest("ca"), [("Cabbage", 4, 1)])
+        self.assertEqual(len(self.index), 4)
+
+    def test_cache_size(self):
+        """It should only cache the most recently used prefixes"""
+        self.index.cache_size = 2
+        for prefix in ("c", "co", "c", "m"):
+            self.index.suggest(prefix)
+        self.assertEqual(list(self.index._top), ["c", "m"])  # pylint: disable=protected-access
+
+    def test_not_built(self):
+        """It should not keep names before it has been built"""
+        index = SuggestIndex()
+        index.change("Coke", likes=1, count=1)
+        self.assertFalse(index.ready)
+        self.assertEqual(len(index), 0)
+
+    def test_invalidate(self):
+        """It should be rebuilt after writes that it could not follow"""
+        self.index.invalidate()
+        self.assertFalse(self.index.ready)
+        self.index.change("Kale", count=1)
+        self.assertEqual(self.index.suggest("ka"), [])
+        self.index.build(lambda: [("Kale", 0, 1)])
+        self.assertTrue(self.index.ready)
+        self.assertEqual(self.index.suggest("ka"), [("Kale", 0, 1)])
+
+    def test_write_during_build(self):
+        """It should stay not ready when a write races with a build"""
+
+        def rows():
+            loaded = [("Coke", 1, 1)]
+            self.index.change("Milk", count=1)
+            return loaded
+
+        self.index.build(rows)
+        self.assertFalse(self.index.ready)
+
+    def test_refresh(self):
+        """It should build from its loader now and every interval until stopped"""
+        loads = []
+
+        def load():
+            loads.append(len(loads))
+            if len(loads) > 2:
+                raise OperationalError("SELECT", {}, Exception("gone"))
+            return [("Kale", len(loads), 1)]
+
+        index = SuggestIndex()
+        index.start(load, 0.01)
+        self.assertEqual(index.suggest("kale"), [("Kale", 1, 1)])
+        while len(loads) < 3:
+            index._stopped.wait(0.01)  # pylint: disable=protected-access
+        index.stop()
+        self.assertEqual(index.suggest("kale"), [("Kale", 2, 1)])